@@ -0,0 +1,141 @@
+import atexit
+import collections
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import tempfile
+import time
+
+RING_SIZE = 2000
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+# Attributes every LogRecord has; anything else was passed through extra= and is printed as key=value
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+_ring = collections.deque(maxlen=RING_SIZE)
+_listener = None
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Standard format followed by the record's extra fields: 'msg mode=dictation latency_ms=812'."""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = {k: v for k, v in vars(record).items() if k not in _STANDARD_ATTRS}
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler.prepare() formats the message on the caller's thread; skip it.
+
+    Records stay in-process, so the listener thread can format them itself. Log
+    arguments must therefore not be mutated after the call (strings/numbers only).
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class RingBufferHandler(logging.Handler):
+    """Keeps the last RING_SIZE formatted lines in memory (viewable from the tray)."""
+
+    def emit(self, record):
+        try:
+            _ring.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+def setup_logging(level: str = None, log_file: str = None):
+    """Routes all loggers through a queue to a background thread.
+
+    Callers only pay for putting the record on the queue; formatting and I/O
+    (console, ring buffer, optional rotating file) happen on the listener thread.
+    Under pythonw there is no console, so only the ring buffer and file are used.
+    """
+    global _listener
+    if _listener:
+        return _listener
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    formatter = KeyValueFormatter(LOG_FORMAT, "%H:%M:%S")
+
+    handlers = []
+    if sys.stdout is not None:
+        handlers.append(logging.StreamHandler(sys.stdout))
+    handlers.append(RingBufferHandler())
+    log_file = log_file or os.getenv("LOG_FILE")
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(log_file, maxBytes=2 * 1024 * 1024, backupCount=3, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers[:] = [DeferredQueueHandler(log_queue)]
+    root.setLevel(level)
+    # Third-party clients are chatty at DEBUG
+    for noisy in ("httpx", "httpcore", "google_genai", "urllib3", "PIL"):
+        logging.getLogger(noisy).setLevel(max(logging.INFO, root.level))
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Flushes queued records (call before os.execl, which skips atexit)."""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
+
+
+def recent_lines(limit: int = None):
+    lines = list(_ring)
+    return lines[-limit:] if limit else lines
+
+
+def dump_recent(path: str = None) -> str:
+    """Writes the ring buffer to a file (to open it from the tray). Returns the path."""
+    path = path or os.path.join(tempfile.gettempdir(), "GeminiDictating", "recent.log")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(recent_lines()) + "\n")
+    return path
+
+
+class AudioCallbackLog:
+    """Logging for the PortAudio callback, which must never block or format strings.
+
+    note() only appends a reference to a bounded deque (atomic in CPython, no lock,
+    no I/O). drain() is called from a normal thread to log what happened.
+    """
+
+    def __init__(self, logger: logging.Logger, size: int = 256):
+        self.logger = logger
+        self.events = collections.deque(maxlen=size)
+        self.count = 0
+
+    def note(self, status):
+        self.count += 1
+        self.events.append((time.monotonic(), status))
+
+    def drain(self):
+        if not self.count:
+            return
+        events = []
+        while self.events:
+            events.append(self.events.popleft())
+        dropped = self.count - len(events)
+        summary = collections.Counter(str(status) for _, status in events)
+        self.logger.warning(
+            "Audio callback reported %d status event(s): %s%s",
+            self.count, dict(summary), f" ({dropped} not kept)" if dropped > 0 else ""
+        )
+        self.count = 0
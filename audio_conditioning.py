@@ -0,0 +1,209 @@
+import argparse
+import json
+import logging
+import math
+import statistics
+import time
+
+import numpy as np
+from scipy import signal
+
+logger = logging.getLogger(__name__)
+
+# config.json: {"audio_conditioning": {"default": {...}, "<microphone name>": {...}}}
+# Opt-in: the recorded audio (and the long-form VAD input) is untouched unless enabled.
+DEFAULT_CONDITIONING = {
+    "enabled": False,
+    "highpass_hz": 60,        # Removes DC offset and rumble (2nd order Butterworth)
+    "normalize": "rms",       # "rms", "peak" or "off"
+    "target_rms_db": -20.0,   # Level of speech after normalisation
+    "target_peak_db": -3.0,
+    "max_gain_db": 24.0,      # A quiet headset gets at most this much boost
+    "min_gain_db": -12.0,     # A hot mic gets at most this much cut
+    "level_ms": 400,          # Averaging time of the speech level: longer than a syllable, so no pumping
+    "attack_ms": 300,         # Time constant of gain reductions (getting louder)
+    "release_ms": 2000,       # Time constant of gain increases (getting quieter)
+    "speech_db": -50.0,       # Blocks below this RMS don't move the gain (silence isn't boosted)
+    "soft_clip": 0.9,         # Knee of the tanh limiter (None: no limiter)
+    "gate_db": None,          # Noise gate: blocks below this RMS are attenuated (None: off)
+    "gate_reduction_db": -20.0,
+}
+
+
+def _db(value: float) -> float:
+    return 20 * np.log10(value + 1e-12)
+
+
+def settings_for(config: dict, microphone: str = None) -> dict:
+    """Conditioning settings of a microphone: defaults < config "default" < config[microphone]."""
+    section = (config or {}).get("audio_conditioning", {})
+    return {**DEFAULT_CONDITIONING, **section.get("default", {}), **section.get(microphone or "", {})}
+
+
+class AudioConditioner:
+    """Incremental conditioning of float32 audio blocks: high-pass, gain normalisation, gate, soft clip.
+
+    Meant for the PortAudio callback: only vectorised NumPy/SciPy operations on the
+    block, no I/O or locks. Filter state is carried from one block to the next, so
+    blocks can be of any size. Gain changes are ramped across the block to avoid clicks.
+    """
+
+    def __init__(self, fs: int, channels: int = 1, **settings):
+        self.settings = {**DEFAULT_CONDITIONING, **settings}
+        self.fs = fs
+        self.channels = channels
+        s = self.settings
+
+        self.sos = None
+        if s["highpass_hz"]:
+            self.sos = signal.butter(2, s["highpass_hz"], btype="highpass", fs=fs, output="sos")
+        self.zi = None  # Filter state, shape (sections, 2, channels)
+
+        self.min_gain = 10 ** (s["min_gain_db"] / 20)
+        self.max_gain = 10 ** (s["max_gain_db"] / 20)
+        self.speech_level = 10 ** (s["speech_db"] / 20)
+        self.gate_level = 10 ** (s["gate_db"] / 20) if s["gate_db"] is not None else None
+        self.gate_floor = 10 ** (s["gate_reduction_db"] / 20)
+        self.knee = s["soft_clip"]
+
+        self.gain = 1.0
+        self.gate_gain = 1.0
+        self.level = None  # Smoothed mean square of speech
+        self.speech_seen = False
+        self.peak = 0.0
+        self.clipped = 0   # Samples that would have clipped (|x| > 1) without the limiter
+        self.samples = 0
+
+    def _coefficient(self, frames: int, time_ms: float) -> float:
+        """Smoothing step for one block of a first-order filter: same time constant whatever the block size."""
+        return 1 - math.exp(-frames / (self.fs * time_ms / 1000)) if time_ms else 1.0
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """Conditions one (frames, channels) block and returns a new float32 block."""
+        x = np.asarray(block, dtype=np.float32)
+        if x.ndim == 1:
+            x = x[:, None]
+        frames = len(x)
+        if not frames:
+            return x.copy()
+        s = self.settings
+
+        # 1. DC / rumble removal, state carried across blocks
+        if self.sos is not None:
+            if self.zi is None:
+                # Start in steady state for the first sample: no step transient from the DC offset
+                self.zi = signal.sosfilt_zi(self.sos)[:, :, None] * x[0]
+            x, self.zi = signal.sosfilt(self.sos, x, axis=0, zi=self.zi)
+            x = x.astype(np.float32, copy=False)
+        else:
+            x = x.copy()
+
+        mean_square = float(np.mean(x * x))
+        rms = math.sqrt(mean_square)
+
+        # 2. Gain: only speech blocks move it, so pauses are not boosted up to the target.
+        # Level and gain are smoothed with time constants, not per block: the AGC then
+        # behaves the same whatever block size PortAudio picks.
+        gain = self.gain
+        if s["normalize"] != "off" and rms > self.speech_level:
+            if s["normalize"] == "peak":
+                # Running peak with ~1 s decay (the final peak isn't known while recording)
+                self.peak = max(self.peak * 0.5 ** (frames / self.fs), float(np.max(np.abs(x))))
+                target = 10 ** (s["target_peak_db"] / 20) / self.peak
+            else:
+                if self.level is None:
+                    self.level = mean_square
+                self.level += self._coefficient(frames, s["level_ms"]) * (mean_square - self.level)
+                target = 10 ** (s["target_rms_db"] / 20) / math.sqrt(self.level)
+            target = min(max(target, self.min_gain), self.max_gain)
+            if not self.speech_seen:
+                # First speech: start at the target instead of converging over seconds
+                self.gain = gain = float(target)
+                self.speech_seen = True
+            else:
+                time_ms = s["attack_ms"] if target < self.gain else s["release_ms"]
+                gain = float(self.gain * (target / self.gain) ** self._coefficient(frames, time_ms))
+
+        # 3. Noise gate (on the input level, before gain)
+        gate_gain = self.gate_gain
+        if self.gate_level is not None:
+            gate_gain = 1.0 if rms >= self.gate_level else self.gate_floor
+
+        start, end = self.gain * self.gate_gain, gain * gate_gain
+        if start == end:
+            x *= end
+        else:
+            x *= np.linspace(start, end, frames, endpoint=False, dtype=np.float32)[:, None]
+        self.gain, self.gate_gain = gain, gate_gain
+
+        # 4. Soft clip: linear below the knee, tanh above, never reaches 1.0
+        over = np.abs(x)
+        self.clipped += int(np.count_nonzero(over > 1.0))
+        if self.knee is not None:
+            knee = self.knee
+            mask = over > knee
+            if mask.any():
+                x[mask] = np.sign(x[mask]) * (knee + (1 - knee) * np.tanh((over[mask] - knee) / (1 - knee)))
+
+        self.samples += frames
+        return x
+
+    def summary(self) -> dict:
+        return {"gain_db": round(float(_db(self.gain)), 1), "clipped": self.clipped, "samples": self.samples}
+
+
+def benchmark(settings: dict, fs: int = 44100, block_sizes=(128, 256, 512, 1024, 2048), seconds: float = 20.0):
+    """CPU time of process() per block vs the block's real-time budget (PortAudio callback period)."""
+    rng = np.random.default_rng(0)
+    results = []
+    for frames in block_sizes:
+        conditioner = AudioConditioner(fs, 1, **settings)
+        count = max(1, int(seconds * fs / frames))
+        t = np.arange(frames) / fs
+        blocks = [(0.05 * np.sin(2 * np.pi * 200 * (t + i * frames / fs)) + 0.01 * rng.standard_normal(frames) + 0.02)
+                  .astype(np.float32)[:, None] for i in range(min(count, 64))]
+        timings = []
+        for i in range(count):
+            started = time.perf_counter()
+            conditioner.process(blocks[i % len(blocks)])
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        budget = frames / fs
+        results.append({
+            "frames": frames,
+            "budget_us": budget * 1e6,
+            "mean_us": statistics.fmean(timings) * 1e6,
+            "p99_us": timings[int(0.99 * (len(timings) - 1))] * 1e6,
+            "max_us": timings[-1] * 1e6,
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Audio conditioning tools.")
+    parser.add_argument("--bench", action="store_true", help="Measure the per-block CPU cost")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--microphone", help="Use this microphone's settings from the config")
+    parser.add_argument("--fs", type=int, default=44100)
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.config, "r") as f:
+            config = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        config = {}
+    settings = settings_for(config, args.microphone or config.get("microphone"))
+    print(f"Settings: {json.dumps(settings)}")
+    if not args.bench:
+        return
+
+    print(f"{'frames':>7} {'budget':>10} {'mean':>9} {'p99':>9} {'max':>9} {'p99 load':>9}")
+    for row in benchmark(settings, args.fs):
+        load = row["p99_us"] / row["budget_us"] * 100
+        warning = "  <- too slow for the audio callback" if load > 10 else ""
+        print(f"{row['frames']:>7} {row['budget_us']:>8.0f}us {row['mean_us']:>7.1f}us {row['p99_us']:>7.1f}us "
+              f"{row['max_us']:>7.1f}us {load:>8.2f}%{warning}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import sys
+import time
+
+from app_logging import setup_logging
+from llm_client import GeminiClient
+from spool import INDEX_FILE, Spool
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = (".wav",)
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+class RateLimiter:
+    """Client-side token bucket shared by all workers (requests per minute)."""
+
+    def __init__(self, rpm: float, burst: int = 1):
+        self.rate = rpm / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                # Holding the lock while waiting keeps the queue FIFO
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def _find_screenshot(audio_path: str):
+    """Returns a screenshot sitting next to the audio file with the same stem, if any."""
+    stem, _ = os.path.splitext(audio_path)
+    for ext in IMAGE_EXTENSIONS:
+        if os.path.exists(stem + ext):
+            return stem + ext
+    return None
+
+
+def load_spool_jobs(root: str, mode: str, with_images: bool = True):
+    """Builds the job list from the app's spool, one job per request that still has its audio."""
+    index = Spool.read_index(root)
+    by_request = {}
+    for name, entry in index["artifacts"].items():
+        by_request.setdefault(entry["request_id"], {})[entry["kind"]] = os.path.join(root, name)
+
+    jobs = []
+    for request_id in sorted(by_request):
+        artifacts = by_request[request_id]
+        if "audio" not in artifacts:
+            continue
+        info = index["requests"].get(request_id, {})
+        jobs.append({
+            "id": request_id,
+            "audio": artifacts["audio"],
+            "image": artifacts.get("screenshot") if with_images else None,
+            "window_title": info.get("window_title"),
+            "mode": info.get("mode", mode),
+        })
+    return jobs
+
+
+def load_jobs(source: str, mode: str, with_images: bool = True):
+    """Builds the job list from a spool, a directory of recordings or a JSONL manifest.
+
+    Manifest lines look like:
+    {"id": "...", "audio": "a.wav", "image": "a.png", "window_title": "...", "mode": "dictation"}
+    Relative paths are resolved against the manifest's directory.
+    """
+    if os.path.isdir(source) and os.path.exists(os.path.join(source, INDEX_FILE)):
+        return load_spool_jobs(source, mode, with_images)
+
+    jobs = []
+    if os.path.isdir(source):
+        paths = []
+        for ext in AUDIO_EXTENSIONS:
+            paths.extend(glob.glob(os.path.join(source, f"*{ext}")))
+        for path in sorted(paths):
+            jobs.append({
+                "id": os.path.splitext(os.path.basename(path))[0],
+                "audio": path,
+                "image": _find_screenshot(path) if with_images else None,
+                "window_title": None,
+                "mode": mode,
+            })
+        return jobs
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            audio = entry.get("audio")
+            image = entry.get("image") if with_images else None
+            if audio and not os.path.isabs(audio):
+                audio = os.path.join(base_dir, audio)
+            if image and not os.path.isabs(image):
+                image = os.path.join(base_dir, image)
+            jobs.append({
+                "id": str(entry.get("id") or os.path.splitext(os.path.basename(audio or f"line{line_no}"))[0]),
+                "audio": audio,
+                "image": image,
+                "window_title": entry.get("window_title"),
+                "mode": entry.get("mode", mode),
+            })
+    return jobs
+
+
+def load_completed(output_path: str, retry_errors: bool = False):
+    """Returns the ids already present in the output file, so an interrupted run can resume."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Truncated last line from a crash: that job will simply be redone
+                continue
+            if retry_errors and entry.get("status") != "ok":
+                continue
+            done.add(entry.get("id"))
+    return done
+
+
+async def run_batch(client, jobs, output_path: str, workers: int = 4, rpm: float = 60, burst: int = 1):
+    """Processes jobs with a bounded worker pool and appends one JSON line per result."""
+    queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+
+    limiter = RateLimiter(rpm, burst)
+    stats = {"ok": 0, "error": 0}
+    started = time.monotonic()
+    total = len(jobs)
+
+    with open(output_path, "a", encoding="utf-8") as out:
+
+        async def worker():
+            while True:
+                try:
+                    job = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await limiter.acquire()
+                t0 = time.perf_counter()
+                result = {
+                    "id": job["id"],
+                    "audio": job["audio"],
+                    "image": job["image"],
+                    "mode": job["mode"],
+                }
+                try:
+                    # GeminiClient is synchronous; run it off the event loop
+                    text = await asyncio.to_thread(
+                        client.process_audio,
+                        job["audio"], job["image"], job["window_title"], job["mode"]
+                    )
+                    result.update(status="ok", text=text)
+                    stats["ok"] += 1
+                except Exception as e:
+                    result.update(status="error", error=str(e))
+                    stats["error"] += 1
+                result["latency_ms"] = round((time.perf_counter() - t0) * 1000)
+
+                # Single-threaded event loop: writes never interleave
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+
+                done = stats["ok"] + stats["error"]
+                elapsed = time.monotonic() - started
+                logger.info(f"{done}/{total} {job['id']} -> {result['status']} "
+                            f"({result['latency_ms']} ms, {done / elapsed * 60:.1f} req/min)")
+
+        await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch transcription of recorded audio through GeminiClient.")
+    parser.add_argument("source", help="Spool directory, directory of .wav files (screenshots matched by file stem) or a JSONL manifest")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="JSONL output file (appended, used to resume)")
+    parser.add_argument("-m", "--mode", default="dictation", help="Default mode for jobs (a name from modes/)")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Concurrent requests")
+    parser.add_argument("--rpm", type=float, default=60, help="Max requests per minute (0 = unlimited)")
+    parser.add_argument("--burst", type=int, default=2, help="Requests allowed back to back before throttling")
+    parser.add_argument("--no-images", action="store_true", help="Ignore screenshots even if available")
+    parser.add_argument("--retry-errors", action="store_true", help="On resume, redo jobs that previously failed")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    jobs = load_jobs(args.source, args.mode, with_images=not args.no_images)
+    done = load_completed(args.output, retry_errors=args.retry_errors)
+    pending = [job for job in jobs if job["id"] not in done]
+    logger.info(f"{len(jobs)} jobs found, {len(jobs) - len(pending)} already done, {len(pending)} to process.")
+    if not pending:
+        return 0
+
+    # Headless and reproducible: fixed image levels, no background probes, the app's usage.json/budget.json
+    # untouched; a thinking job routed to image generation drafts text instead of touching the clipboard
+    client = GeminiClient(adaptive_budget=False, usage_path=None, image_generation=False)
+    for mode in {job["mode"] for job in pending}:
+        client.modes.get(mode)  # Fail fast on unknown modes
+    try:
+        stats = asyncio.run(run_batch(client, pending, args.output, args.workers, args.rpm, args.burst))
+    except KeyboardInterrupt:
+        logger.info("Interrupted. Run the same command again to resume.")
+        return 130
+
+    logger.info(f"Finished: {stats['ok']} ok, {stats['error']} errors. Results in {args.output}")
+    return 1 if stats["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
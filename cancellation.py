@@ -0,0 +1,61 @@
+import threading
+
+
+class RequestCancelled(BaseException):
+    """Raised in the worker of a cancelled request.
+
+    Like asyncio.CancelledError it derives from BaseException, so the many
+    `except Exception` fallbacks (retry loop, thinking steps, image generation)
+    let it through instead of turning a cancellation into an empty result.
+    """
+
+
+class CancelToken:
+    """Cancellation flag shared by a request's worker and whoever may abort it (hotkey, IPC).
+
+    cancel() wakes sleep() at once and runs the registered callbacks, which is how
+    an in-flight HTTP call is aborted (the callback cancels its future).
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.reason = None
+        self.lock = threading.Lock()
+        self.callbacks = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.reason = reason
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback):
+        """Runs callback() on cancel (immediately if already cancelled). Returns a function removing it."""
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback):
+        with self.lock:
+            if callback in self.callbacks:
+                self.callbacks.remove(callback)
+
+    def raise_if_cancelled(self):
+        if self.event.is_set():
+            raise RequestCancelled(self.reason)
+
+    def sleep(self, seconds: float):
+        """time.sleep() that returns early, raising RequestCancelled, when the token is cancelled."""
+        if self.event.wait(seconds):
+            raise RequestCancelled(self.reason)
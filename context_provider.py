@@ -3,24 +3,48 @@ import pygetwindow as gw
 from PIL import Image, ImageGrab, ImageDraw
 import tempfile
 import os
+import logging
+import time
 import mss
 
+logger = logging.getLogger(__name__)
+
+UNKNOWN_WINDOW_TITLES = ("Inconnue", "Erreur")  # Returned when the active window can't be read
+
 class ContextProvider:
+    def __init__(self, spool=None):
+        self.spool = spool
+
     def get_active_window_title(self):
         try:
             window = gw.getActiveWindow()
             if window:
                 return window.title
-            return "Inconnue"
+            return UNKNOWN_WINDOW_TITLES[0]
         except Exception as e:
-            print(f"Erreur recuperation titre fenêtre: {e}")
-            return "Erreur"
+            logger.error(f"Erreur recuperation titre fenêtre: {e}")
+            return UNKNOWN_WINDOW_TITLES[1]
+
+    def capture_screen_with_cursor(self, request_id: str = None, stats: dict = None, fingerprint_px: int = None):
+        """Captures the specific monitor where the cursor is and highlights the cursor position.
+
+        If a stats dict is given, it is filled with the duration of each stage (ms),
+        the image size and the PNG size. With fingerprint_px, it also gets the
+        perceptual hash of the fingerprint_px square around the cursor ("fingerprint").
+        """
+        stages = {}
+        mark = time.perf_counter()
+
+        def stage(name):
+            nonlocal mark
+            now = time.perf_counter()
+            stages[name] = round((now - mark) * 1000, 1)
+            mark = now
 
-    def capture_screen_with_cursor(self):
-        """Captures the specific monitor where the cursor is and highlights the cursor position."""
         try:
             # Get global cursor position
             x, y = pyautogui.position()
+            stage("cursor")
             
             with mss.mss() as sct:
                 # Find the monitor containing the cursor
@@ -41,16 +65,26 @@ class ContextProvider:
                 # Fallback to primary if not found (shouldn't happen)
                 if not active_monitor:
                     active_monitor = sct.monitors[1] if len(sct.monitors) > 1 else sct.monitors[0]
+                stage("monitor")
 
                 # Capture only the active monitor
                 sct_img = sct.grab(active_monitor)
+                stage("grab")
                 screenshot = Image.frombytes("RGB", sct_img.size, sct_img.bgra, "raw", "BGRX")
-                screenshot = screenshot.convert("RGBA")
+                stage("convert")
 
                 # Calculate local cursor position relative to this monitor
                 local_x = x - active_monitor["left"]
                 local_y = y - active_monitor["top"]
 
+                # Before the highlight is drawn: it sits at the cursor in every capture
+                fingerprint = None
+                if fingerprint_px:
+                    fingerprint = crop_fingerprint(screenshot, local_x, local_y, fingerprint_px)
+                    stage("fingerprint")
+
+                screenshot = screenshot.convert("RGBA")
+
                 # Create a transparent overlay
                 overlay = Image.new('RGBA', screenshot.size, (255, 255, 255, 0))
                 draw = ImageDraw.Draw(overlay)
@@ -63,14 +97,42 @@ class ContextProvider:
                 
                 # Composite
                 screenshot = Image.alpha_composite(screenshot, overlay)
+                stage("overlay")
                 
-                # Save to temp file
-                fd, path = tempfile.mkstemp(suffix=".png")
-                os.close(fd)
+                # Save to the spool (or a temp file)
+                if self.spool:
+                    path = self.spool.allocate(request_id, "screenshot", ".png")
+                else:
+                    fd, path = tempfile.mkstemp(suffix=".png")
+                    os.close(fd)
                 
                 screenshot.save(path)
+                stage("encode")
+                png_bytes = os.path.getsize(path)
+                if self.spool:
+                    path = self.spool.commit(path, meta={"cursor": [local_x, local_y], "size": list(screenshot.size), "stages_ms": dict(stages)})
+                    stage("spool")
+
+                if stats is not None:
+                    stats.update(stages_ms=stages, size=list(screenshot.size), png_bytes=png_bytes, fingerprint=fingerprint)
                 return path
 
         except Exception as e:
-            print(f"Erreur capture écran: {e}")
+            logger.error(f"Erreur capture écran: {e}")
             return None
+
+
+def crop_fingerprint(image, x: int, y: int, size: int) -> int:
+    """64-bit difference hash (dHash) of the size x size square centred on (x, y).
+
+    Robust to re-encoding and small rendering changes (caret blink, antialiasing):
+    two captures of the same screen region differ by a few bits at most.
+    """
+    half = size // 2
+    crop = image.crop((x - half, y - half, x + half, y + half))
+    pixels = list(crop.convert("L").resize((9, 8), Image.BILINEAR).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
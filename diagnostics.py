@@ -0,0 +1,111 @@
+import gc
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+
+def _process_counters() -> dict:
+    """Resident memory and open handles (file descriptors on POSIX) of this process."""
+    counters = {"rss_bytes": None, "handles": None}
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        memory = PROCESS_MEMORY_COUNTERS()
+        memory.cb = ctypes.sizeof(memory)
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(memory), memory.cb):
+            counters["rss_bytes"] = memory.WorkingSetSize
+        handles = wintypes.DWORD()
+        if ctypes.windll.kernel32.GetProcessHandleCount(process, ctypes.byref(handles)):
+            counters["handles"] = handles.value
+        # GDI objects leak separately from kernel handles (screenshots, clipboard, tray icon)
+        counters["gdi_objects"] = ctypes.windll.user32.GetGuiResources(process, 0)
+        return counters
+
+    try:
+        with open("/proc/self/statm", "r") as f:
+            counters["rss_bytes"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        counters["handles"] = len(os.listdir("/proc/self/fd"))
+    except OSError:
+        pass
+    return counters
+
+
+def sample() -> dict:
+    """One measurement of the process: memory, handles, threads, Python objects.
+
+    Cheap enough to call from the tray or the IPC API at any time. The traced
+    Python heap is only reported when tracemalloc is running (start_tracing()).
+    """
+    result = {
+        "time": time.time(),
+        **_process_counters(),
+        "threads": threading.active_count(),
+        "gc_objects": len(gc.get_objects()),
+    }
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        result["traced_bytes"] = current
+        result["traced_peak_bytes"] = peak
+    return result
+
+
+def start_tracing(frames: int = 5):
+    """Starts tracemalloc (slows allocations down: diagnostics/soak runs only)."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        logger.info(f"tracemalloc started ({frames} frames)")
+
+
+def top_growth(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, limit: int = 10):
+    """Source lines whose allocations grew the most between two snapshots."""
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")]
+    stats = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+    return [(str(stat.traceback), stat.size_diff, stat.count_diff) for stat in stats[:limit] if stat.size_diff > 0]
+
+
+def slope(points) -> float:
+    """Least-squares growth per unit of x for [(x, y), ...] (e.g. bytes per request)."""
+    points = [(x, y) for x, y in points if y is not None]
+    if len(points) < 2:
+        return 0.0
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if not var_x:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+
+
+def format_sample(values: dict) -> str:
+    parts = []
+    if values.get("rss_bytes") is not None:
+        parts.append(f"RSS {values['rss_bytes'] / 1024 / 1024:.1f} MB")
+    if values.get("traced_bytes") is not None:
+        parts.append(f"traced {values['traced_bytes'] / 1024 / 1024:.1f} MB")
+    if values.get("handles") is not None:
+        parts.append(f"{values['handles']} handles")
+    if values.get("gdi_objects") is not None:
+        parts.append(f"{values['gdi_objects']} GDI objects")
+    parts.append(f"{values['threads']} threads")
+    parts.append(f"{values['gc_objects']} objects")
+    return ", ".join(parts)
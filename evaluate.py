@@ -0,0 +1,373 @@
+import argparse
+import difflib
+import hashlib
+import itertools
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from app_logging import setup_logging
+from spool import Spool
+
+logger = logging.getLogger(__name__)
+
+# Variant keys applied to the mode spec (see modes/*.json), plus "steps.<step>.<key>" for
+# multi-step modes (ModeRegistry.derive); the others are preprocessing
+MODE_KEYS = ("model", "prompt", "system_instruction", "temperature", "image_level")
+PREPROCESS_KEYS = ("sample_rate", "crop")
+
+
+def mode_overrides(variant: dict) -> dict:
+    return {key: value for key, value in variant.items() if key in MODE_KEYS or key.startswith("steps.")}
+
+
+def load_corpus(manifest: str):
+    """Golden set: JSONL lines with id, audio, image, window_title, mode, expected and optional cursor [x, y]."""
+    base_dir = os.path.dirname(os.path.abspath(manifest))
+    cases = []
+    with open(manifest, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            case = json.loads(line)
+            for key in ("audio", "image"):
+                if case.get(key) and not os.path.isabs(case[key]):
+                    case[key] = os.path.join(base_dir, case[key])
+            case.setdefault("mode", "dictation")
+            cases.append(case)
+    return cases
+
+
+def load_variants(path: str):
+    """Variants file: {"variants": [{"name": ..., <overrides>}]} and/or {"axes": {key: [values]}} (cartesian product)."""
+    with open(path, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+    variants = list(spec.get("variants", []))
+    axes = spec.get("axes", {})
+    if axes:
+        keys = sorted(axes)
+        for values in itertools.product(*(axes[key] for key in keys)):
+            overrides = {key: value for key, value in zip(keys, values) if value is not None}
+            name = ",".join(f"{key}={value}" for key, value in overrides.items()) or "baseline"
+            variants.append({"name": name, **overrides})
+    if not variants:
+        variants = [{"name": "baseline"}]
+    unknown = {key for v in variants for key in v if not key.startswith("steps.")} - set(MODE_KEYS) - set(PREPROCESS_KEYS) - {"name"}
+    if unknown:
+        raise ValueError(f"Unknown variant keys: {', '.join(sorted(unknown))}")
+    return variants
+
+
+# --- Scoring ---
+
+def normalize(text: str):
+    return re.sub(r"[^\w\s']", " ", (text or "").lower()).split()
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """Levenshtein distance over normalized words, divided by the reference length."""
+    ref, hyp = normalize(reference), normalize(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def score(mode: str, expected: str, output: str) -> float:
+    """Accuracy in [0, 1]: 1 - WER for dictation, text similarity for free-form modes."""
+    if mode == "dictation":
+        return max(0.0, 1.0 - word_error_rate(expected, output))
+    return difflib.SequenceMatcher(None, " ".join(normalize(expected)), " ".join(normalize(output))).ratio()
+
+
+# --- Preprocessing ---
+
+def resample_wav(path: str, sample_rate: int, out_dir: str) -> str:
+    import numpy as np
+    import scipy.io.wavfile as wav
+    from scipy.signal import resample_poly
+
+    source_rate, data = wav.read(path)
+    if source_rate == sample_rate:
+        return path
+    gcd = np.gcd(source_rate, sample_rate)
+    resampled = resample_poly(data.astype(np.float32), sample_rate // gcd, source_rate // gcd, axis=0)
+    out_path = os.path.join(out_dir, f"{os.path.splitext(os.path.basename(path))[0]}_{sample_rate}.wav")
+    wav.write(out_path, sample_rate, np.clip(resampled, -32768, 32767).astype(np.int16))
+    return out_path
+
+
+def crop_around_cursor(path: str, cursor, size: int, out_dir: str) -> str:
+    """Crops a size x size box centred on the cursor (image centre if unknown)."""
+    from PIL import Image
+
+    with Image.open(path) as image:
+        width, height = image.size
+        x, y = cursor if cursor else (width // 2, height // 2)
+        left = min(max(0, x - size // 2), max(0, width - size))
+        top = min(max(0, y - size // 2), max(0, height - size))
+        cropped = image.crop((left, top, min(width, left + size), min(height, top + size)))
+        out_path = os.path.join(out_dir, f"{os.path.splitext(os.path.basename(path))[0]}_crop{size}.png")
+        cropped.save(out_path)
+    return out_path
+
+
+def prepare_inputs(case: dict, variant: dict, work_dir: str, cache: dict):
+    """Returns (audio, image) paths for a case under a variant's preprocessing (cached)."""
+    key = (case["id"], variant.get("sample_rate"), variant.get("crop"))
+    if key not in cache:
+        audio, image = case.get("audio"), case.get("image")
+        if audio and variant.get("sample_rate"):
+            audio = resample_wav(audio, int(variant["sample_rate"]), work_dir)
+        if image and variant.get("crop"):
+            image = crop_around_cursor(image, case.get("cursor"), int(variant["crop"]), work_dir)
+        cache[key] = (audio, image)
+    return cache[key]
+
+
+# --- Runners ---
+
+def recording_key(case: dict, variant: dict) -> str:
+    """Identifies a (case, variant) pair in a recording, independent of file locations."""
+    digest = hashlib.sha1()
+    for key in ("audio", "image"):
+        if case.get(key) and os.path.exists(case[key]):
+            with open(case[key], "rb") as f:
+                digest.update(f.read())
+    spec = {k: v for k, v in variant.items() if k != "name"}
+    payload = json.dumps([case["id"], case["mode"], case.get("window_title"), spec], sort_keys=True)
+    digest.update(payload.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class LiveRunner:
+    """Calls GeminiClient sequentially (concurrency would distort latencies)."""
+
+    def __init__(self, work_dir: str):
+        from llm_client import GeminiClient
+
+        # No adaptive budget (its probes would be counted), no persisted usage stats, and
+        # headless: no paid image generation or clipboard write (thinking cases draft text)
+        self.client = GeminiClient(adaptive_budget=False, usage_path=None, image_generation=False)
+        self.work_dir = work_dir
+        self.cache = {}
+
+    def check(self, cases, variants):
+        """Fails before any call if a variant doesn't apply to a mode of the corpus (e.g. 'model' on thinking)."""
+        for mode_name in {case["mode"] for case in cases}:
+            for variant in variants:
+                self.client.modes.derive(mode_name, **mode_overrides(variant))
+
+    def run(self, case: dict, variant: dict) -> dict:
+        mode = self.client.modes.derive(case["mode"], **mode_overrides(variant))
+        audio, image = prepare_inputs(case, variant, self.work_dir, self.cache)
+
+        before = self.client.usage.grand_total()
+        started = time.perf_counter()
+        output = self.client.process_audio(audio, image, case.get("window_title"), mode=mode)
+        latency_ms = (time.perf_counter() - started) * 1000
+        after = self.client.usage.grand_total()
+        return {
+            "output": output,
+            "latency_ms": round(latency_ms),
+            "input_tokens": after["prompt"] - before["prompt"],
+            "output_tokens": after["output"] - before["output"],
+        }
+
+
+class ReplayRunner:
+    """Serves results from a recording: no network, no API key (CI)."""
+
+    def __init__(self, recording: dict):
+        self.recording = recording
+
+    def run(self, case: dict, variant: dict) -> dict:
+        key = recording_key(case, variant)
+        if key not in self.recording:
+            raise KeyError(f"No recorded response for case '{case['id']}' / variant '{variant['name']}'")
+        return dict(self.recording[key])
+
+
+# --- Report ---
+
+def pareto_front(summaries):
+    """Variants not dominated on (accuracy up, latency down, tokens down)."""
+    front = []
+    for a in summaries:
+        dominated = any(
+            b is not a
+            and b["accuracy"] >= a["accuracy"] and b["latency_ms"] <= a["latency_ms"] and b["tokens"] <= a["tokens"]
+            and (b["accuracy"] > a["accuracy"] or b["latency_ms"] < a["latency_ms"] or b["tokens"] < a["tokens"])
+            for b in summaries
+        )
+        if not dominated:
+            front.append(a["variant"])
+    return front
+
+
+def summarize(results, tolerance: float):
+    summaries = []
+    for name in dict.fromkeys(r["variant"] for r in results):
+        rows = [r for r in results if r["variant"] == name and "error" not in r]
+        if not rows:
+            continue
+        latencies = [r["latency_ms"] for r in rows]
+        summaries.append({
+            "variant": name,
+            "cases": len(rows),
+            "errors": sum(1 for r in results if r["variant"] == name and "error" in r),
+            "accuracy": round(statistics.mean(r["score"] for r in rows), 4),
+            "latency_ms": round(statistics.median(latencies)),
+            "latency_p90_ms": round(sorted(latencies)[math.ceil(0.9 * len(latencies)) - 1]),
+            "tokens": round(statistics.mean(r["input_tokens"] + r["output_tokens"] for r in rows)),
+        })
+
+    front = pareto_front(summaries)
+    for summary in summaries:
+        summary["pareto"] = summary["variant"] in front
+
+    recommended = None
+    if summaries:
+        best = max(s["accuracy"] for s in summaries)
+        eligible = [s for s in summaries if s["accuracy"] >= best - tolerance]
+        recommended = min(eligible, key=lambda s: (s["latency_ms"], s["tokens"]))["variant"]
+    return {"variants": summaries, "pareto": front, "recommended": recommended, "tolerance": tolerance}
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        "| variant | accuracy | median latency (ms) | p90 latency (ms) | tokens/request | errors | pareto |",
+        "|---|---|---|---|---|---|---|",
+    ]
+    for s in sorted(report["variants"], key=lambda s: s["latency_ms"]):
+        lines.append(f"| {s['variant']} | {s['accuracy']:.3f} | {s['latency_ms']} | {s['latency_p90_ms']} | "
+                     f"{s['tokens']} | {s['errors']} | {'*' if s['pareto'] else ''} |")
+    if report["recommended"]:
+        lines.append("")
+        lines.append(f"Recommended (fastest within {report['tolerance']:.3f} of the best accuracy): {report['recommended']}")
+    return "\n".join(lines)
+
+
+def evaluate(cases, variants, runner, recording: dict = None):
+    results = []
+    for variant in variants:
+        for case in cases:
+            row = {"variant": variant["name"], "case": case["id"], "mode": case["mode"]}
+            try:
+                outcome = runner.run(case, variant)
+                if recording is not None:
+                    recording[recording_key(case, variant)] = outcome
+                row.update(outcome)
+                row["score"] = round(score(case["mode"], case.get("expected", ""), outcome["output"]), 4)
+            except Exception as e:
+                logger.error(f"{variant['name']} / {case['id']} failed: {e}")
+                row["error"] = str(e)
+            results.append(row)
+            logger.info(f"{variant['name']} / {case['id']}: score={row.get('score')} latency={row.get('latency_ms')} ms")
+    return results
+
+
+def export_spool(spool_dir: str, out_dir: str):
+    """Copies spool requests into a corpus skeleton. 'expected' is the app's output: review it by hand."""
+    index = Spool.read_index(spool_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    by_request = {}
+    for name, entry in index["artifacts"].items():
+        by_request.setdefault(entry["request_id"], {})[entry["kind"]] = (name, entry)
+
+    count = 0
+    with open(os.path.join(out_dir, "manifest.jsonl"), "a", encoding="utf-8") as manifest:
+        for request_id in sorted(by_request):
+            artifacts = by_request[request_id]
+            info = index["requests"].get(request_id, {})
+            case = {"id": request_id, "mode": info.get("mode", "dictation"),
+                    "window_title": info.get("window_title"), "expected": info.get("text", "")}
+            for kind, key in (("audio", "audio"), ("screenshot", "image")):
+                if kind in artifacts:
+                    name, entry = artifacts[kind]
+                    shutil.copy2(os.path.join(spool_dir, name), os.path.join(out_dir, name))
+                    case[key] = name
+                    if kind == "screenshot" and entry["meta"].get("cursor"):
+                        case["cursor"] = entry["meta"]["cursor"]
+            manifest.write(json.dumps(case, ensure_ascii=False) + "\n")
+            count += 1
+    logger.info(f"Exported {count} request(s) to {out_dir}/manifest.jsonl")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Golden-set evaluation: accuracy vs latency vs tokens across configurations.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Replay a corpus under a matrix of configurations")
+    run.add_argument("manifest", help="Corpus JSONL (id, audio, image, window_title, mode, expected, cursor)")
+    run.add_argument("-v", "--variants", help="Variants JSON ('variants' list and/or 'axes' matrix)")
+    run.add_argument("-o", "--report", default="eval_report.json", help="JSON report path")
+    run.add_argument("--record", help="Save responses to this file for offline replays")
+    run.add_argument("--replay", help="Use responses recorded with --record (offline, for CI)")
+    run.add_argument("--tolerance", type=float, default=0.01, help="Accuracy loss accepted for the recommendation")
+    run.add_argument("--min-accuracy", type=float, help="Exit with an error if the recommended variant scores below this")
+
+    export = sub.add_parser("export-spool", help="Turn spool requests into a corpus skeleton")
+    export.add_argument("spool_dir")
+    export.add_argument("out_dir")
+
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    if args.command == "export-spool":
+        export_spool(args.spool_dir, args.out_dir)
+        return 0
+
+    cases = load_corpus(args.manifest)
+    variants = load_variants(args.variants) if args.variants else [{"name": "baseline"}]
+    logger.info(f"{len(cases)} case(s) x {len(variants)} variant(s)")
+
+    recording = None
+    with tempfile.TemporaryDirectory(prefix="gemini_eval_") as work_dir:
+        if args.replay:
+            with open(args.replay, "r", encoding="utf-8") as f:
+                runner = ReplayRunner(json.load(f))
+        else:
+            runner = LiveRunner(work_dir)
+            try:
+                runner.check(cases, variants)
+            except (KeyError, ValueError) as e:
+                logger.error(f"Invalid variant: {e}")
+                return 2
+            recording = {} if args.record else None
+        results = evaluate(cases, variants, runner, recording)
+
+    if recording is not None:
+        with open(args.record, "w", encoding="utf-8") as f:
+            json.dump(recording, f, ensure_ascii=False, indent=1)
+
+    report = summarize(results, args.tolerance)
+    report["results"] = results
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    print(format_report(report))
+
+    if any("error" in r for r in results):
+        return 1
+    if args.min_accuracy is not None:
+        recommended = next((s for s in report["variants"] if s["variant"] == report["recommended"]), None)
+        if not recommended or recommended["accuracy"] < args.min_accuracy:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,338 @@
+import argparse
+import base64
+import hmac
+import json
+import logging
+import os
+import secrets
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+
+import diagnostics
+from cancellation import RequestCancelled
+from spool import Spool
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.path.join(tempfile.gettempdir(), "GeminiDictating")
+LOCK_FILE = os.path.join(STATE_DIR, "instance.lock")
+ENDPOINT_FILE = os.path.join(STATE_DIR, "ipc.json")
+MAX_LINE_BYTES = 64 * 1024 * 1024  # Inline (base64) audio of a long dictation
+
+# Inline inputs: request key -> (spool kind, suffix)
+INLINE_INPUTS = {"audio": ("audio", ".wav"), "image": ("screenshot", ".png")}
+
+
+class InstanceLock:
+    """OS-level exclusive lock on a file: released by the OS if the process dies."""
+
+    def __init__(self, path: str = None):
+        self.path = path or LOCK_FILE
+        self.fd = None
+
+    def acquire(self) -> bool:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if sys.platform == "win32":
+                import msvcrt
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self.fd = fd
+        return True
+
+    def release(self):
+        if self.fd is None:
+            return
+        try:
+            if sys.platform == "win32":
+                import msvcrt
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        except OSError:
+            pass
+        os.close(self.fd)
+        self.fd = None
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """One connection: JSON requests, one per line; each answered by one or more JSON event lines."""
+
+    def handle(self):
+        server = self.server.ipc
+        while True:
+            line = self.rfile.readline(MAX_LINE_BYTES)
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError:
+                self.send({"event": "error", "error": "invalid JSON"})
+                break
+            if not hmac.compare_digest(str(request.get("token", "")), server.token):
+                self.send({"event": "error", "error": "unauthorized"})
+                break
+            try:
+                server.dispatch(request, self.send)
+            except ConnectionError:
+                # Client went away mid-stream
+                break
+            except RequestCancelled as e:
+                if not self.reply({"event": "cancelled", "reason": str(e)}):
+                    break
+            except Exception as e:
+                # Also a broken pipe in on_delta, wrapped as PartialStreamError by the client
+                logger.warning(f"IPC {request.get('cmd')} failed: {e}")
+                if not self.reply({"event": "error", "error": str(e)}):
+                    break
+
+    def reply(self, message: dict) -> bool:
+        """send() for final events: False if the client is gone (instead of a traceback from socketserver)."""
+        try:
+            self.send(message)
+            return True
+        except OSError:
+            return False
+
+    def send(self, message: dict):
+        self.wfile.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = False
+
+
+class IpcServer:
+    """Local API of the running app (127.0.0.1 only), so other tools reuse its warm client.
+
+    The port and a random token are written to ENDPOINT_FILE, in the user's temp
+    directory; every request must carry the token. Commands:
+      status                              -> {"event": "status", ...}
+      modes                               -> {"event": "modes", "modes": {...}}
+      diagnostics                         -> {"event": "diagnostics", rss_bytes, handles, threads...}
+      submit  mode, audio|audio_b64, image|image_b64, window_title, paste
+                                          -> accepted, delta*, done (or cancelled)
+      trigger mode, seconds, paste        -> accepted, delta*, done (or cancelled)
+        done: {"request_id", "text"}, or {"request_id", "text": "", "image": path} when a
+        thinking request generated an image (copied to the clipboard only with paste)
+      cancel  [request_id]                -> {"event": "cancelled", "request_ids": [...]}
+    """
+
+    def __init__(self, app, port: int = 0, endpoint_file: str = None):
+        self.app = app
+        self.port = port
+        self.endpoint_file = endpoint_file or ENDPOINT_FILE
+        self.token = secrets.token_hex(16)
+        self.server = None
+
+    def start(self):
+        self.server = _TCPServer(("127.0.0.1", self.port), _Handler)
+        self.server.ipc = self
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True, name="ipc").start()
+
+        os.makedirs(os.path.dirname(self.endpoint_file), exist_ok=True)
+        tmp_path = self.endpoint_file + ".partial"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"port": self.port, "token": self.token, "pid": os.getpid()}, f)
+        os.replace(tmp_path, self.endpoint_file)
+        logger.info(f"IPC listening on 127.0.0.1:{self.port}")
+
+    def stop(self):
+        if not self.server:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = None
+        try:
+            os.remove(self.endpoint_file)
+        except OSError:
+            pass
+
+    def dispatch(self, request: dict, send):
+        handlers = {
+            "status": self._status,
+            "diagnostics": self._diagnostics,
+            "modes": self._modes,
+            "submit": self._submit,
+            "trigger": self._trigger,
+            "cancel": self._cancel,
+        }
+        cmd = request.get("cmd")
+        if cmd not in handlers:
+            raise ValueError(f"Unknown command '{cmd}' (expected one of {', '.join(handlers)})")
+        handlers[cmd](request, send)
+
+    def _status(self, request, send):
+        send({"event": "status", **self.app.status()})
+
+    def _diagnostics(self, request, send):
+        send({"event": "diagnostics", **diagnostics.sample()})
+
+    def _modes(self, request, send):
+        modes = {mode.name: {"label": mode.label, "hotkey": mode.hotkey, "needs_audio": mode.needs_audio}
+                 for mode in self.app.modes.modes.values()}
+        send({"event": "modes", "modes": modes})
+
+    def _submit(self, request, send):
+        mode = self.app.modes.get(request.get("mode", "dictation"))
+        request_id = Spool.new_request_id()
+        window_title = request.get("window_title")
+        audio_path = self._input_file(request, "audio", request_id)
+        image_path = self._input_file(request, "image", request_id)
+        if mode.needs_audio and not audio_path:
+            raise ValueError(f"Mode '{mode.name}' needs audio")
+        self.app.spool.annotate(request_id, mode=mode.name, window_title=window_title, source="ipc")
+        send({"event": "accepted", "request_id": request_id})
+
+        token = self.app.track(request_id, window_title, source="ipc")
+        try:
+            text = self.app.client.process_audio(
+                audio_path, image_path, window_title, mode=mode, request_id=request_id,
+                on_delta=lambda delta: send({"event": "delta", "text": delta}), cancel=token
+            )
+            token.raise_if_cancelled()
+        finally:
+            self.app.untrack(request_id)
+        self.app.spool.annotate(request_id, text=text)
+        if request.get("paste"):
+            self.app.deliver(mode, text)
+        send(self._done(request_id, text))
+
+    def _trigger(self, request, send):
+        send({"event": "accepted", "mode": request.get("mode")})
+        request_id, text = self.app.trigger(
+            request.get("mode"), seconds=request.get("seconds"), paste=request.get("paste", True),
+            on_delta=lambda delta: send({"event": "delta", "text": delta})
+        )
+        send(self._done(request_id, text))
+
+    @staticmethod
+    def _done(request_id, text) -> dict:
+        """Final event; a generated image is returned as its path (the clipboard is only used with paste)."""
+        from llm_client import GeneratedImage  # Not at the top: the CLI must not need google-genai
+
+        if isinstance(text, GeneratedImage):
+            return {"event": "done", "request_id": request_id, "text": "", "image": str(text)}
+        return {"event": "done", "request_id": request_id, "text": text}
+
+    def _cancel(self, request, send):
+        request_ids = self.app.cancel(request_id=request.get("request_id"), reason="cancelled via IPC")
+        send({"event": "cancelled", "request_ids": request_ids})
+
+    def _input_file(self, request, key, request_id):
+        """A local path sent as-is, or inline base64 data written to the spool."""
+        path = request.get(key)
+        if path:
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"{key} not found: {path}")
+            return path
+        data = request.get(f"{key}_b64")
+        if not data:
+            return None
+        kind, suffix = INLINE_INPUTS[key]
+        partial_path = self.app.spool.allocate(request_id, kind, suffix)
+        with open(partial_path, "wb") as f:
+            f.write(base64.b64decode(data))
+        return self.app.spool.commit(partial_path, meta={"source": "ipc"})
+
+
+class IpcClient:
+    """Talks to the running app. Used by the CLI below and meant to be copied into other tools."""
+
+    def __init__(self, endpoint_file: str = None, timeout: float = 300):
+        try:
+            with open(endpoint_file or ENDPOINT_FILE, "r", encoding="utf-8") as f:
+                endpoint = json.load(f)
+        except FileNotFoundError:
+            raise ConnectionError("The app is not running (no IPC endpoint file)")
+        self.port = endpoint["port"]
+        self.token = endpoint["token"]
+        self.timeout = timeout
+
+    def request(self, cmd: str, **fields):
+        """Yields the response events; the last one is 'done', 'status', 'modes' or 'error'."""
+        with socket.create_connection(("127.0.0.1", self.port), timeout=self.timeout) as sock:
+            sock.sendall((json.dumps({"token": self.token, "cmd": cmd, **fields}) + "\n").encode("utf-8"))
+            with sock.makefile("r", encoding="utf-8") as reader:
+                for line in reader:
+                    event = json.loads(line)
+                    yield event
+                    if event.get("event") not in ("accepted", "delta"):
+                        return
+
+    def call(self, cmd: str, on_delta=None, **fields) -> dict:
+        """Runs a command and returns its final event (raises on error)."""
+        for event in self.request(cmd, **fields):
+            if event["event"] == "delta" and on_delta:
+                on_delta(event["text"])
+            elif event["event"] == "error":
+                raise RuntimeError(event["error"])
+            elif event["event"] not in ("accepted", "delta"):
+                return event
+        raise ConnectionError("Connection closed before the end of the response")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Talk to the running Gemini Dictating Agent.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("status")
+    sub.add_parser("modes")
+    sub.add_parser("diagnostics")
+    cancel = sub.add_parser("cancel", help="Cancel in-flight requests (all by default)")
+    cancel.add_argument("request_id", nargs="?")
+    submit = sub.add_parser("submit", help="Process an audio file (and screenshot) with a mode")
+    submit.add_argument("audio", nargs="?")
+    submit.add_argument("--image")
+    submit.add_argument("--mode", default="dictation")
+    submit.add_argument("--window-title")
+    submit.add_argument("--paste", action="store_true", help="Also paste the result in the active app")
+    submit.add_argument("--inline", action="store_true", help="Send file contents instead of paths")
+    trigger = sub.add_parser("trigger", help="Run a mode as if its hotkey was pressed")
+    trigger.add_argument("mode")
+    trigger.add_argument("--seconds", type=float, help="Recording length for audio modes")
+    trigger.add_argument("--no-paste", action="store_true")
+    args = parser.parse_args(argv)
+
+    client = IpcClient()
+    fields = {}
+    if args.cmd == "submit":
+        fields = {"mode": args.mode, "window_title": args.window_title, "paste": args.paste}
+        for key in ("audio", "image"):
+            path = getattr(args, key)
+            if path and args.inline:
+                with open(path, "rb") as f:
+                    fields[f"{key}_b64"] = base64.b64encode(f.read()).decode("ascii")
+            elif path:
+                fields[key] = os.path.abspath(path)
+    elif args.cmd == "cancel":
+        fields = {"request_id": args.request_id}
+    elif args.cmd == "trigger":
+        fields = {"mode": args.mode, "seconds": args.seconds, "paste": not args.no_paste}
+
+    streamed = args.cmd in ("submit", "trigger")
+    on_delta = (lambda text: print(text, end="", flush=True)) if streamed else None
+    result = client.call(args.cmd, on_delta=on_delta, **fields)
+    if streamed:
+        print()
+        if result["event"] == "cancelled":
+            print(f"Cancelled: {result.get('reason')}")
+        elif result.get("image"):
+            print(f"Image: {result['image']}")
+    else:
+        result.pop("event", None)
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,80 @@
 from google import genai
 from google.genai import types
 import os
+import logging
 import json
 import subprocess
 import tempfile
 import ctypes
+import threading
 import time
+import asyncio
+import concurrent.futures
+import queue
 from io import BytesIO
+from types import SimpleNamespace
 from PIL import Image
 from dotenv import load_dotenv
 
+from cancellation import RequestCancelled
+from quota import QuotaScheduler, is_rate_limit_error, parse_retry_delay
+from usage import BudgetController, UsageTracker
+from modes import ModeRegistry
+
+logger = logging.getLogger(__name__)
+
 load_dotenv(override=True)
 
+# Fallback map (503 overload and long 429 waits)
+FALLBACK_MODELS = {
+    "gemini-2.5-flash-lite": "gemini-3-flash-preview",
+    "gemini-3-pro-preview": "gemini-2.5-pro",
+}
+
+class PartialStreamError(RuntimeError):
+    """A streamed response failed after some text was already delivered (not retried)."""
+
+
+class GeneratedImage(str):
+    """Result of a request routed to image generation: the path of the PNG (in the spool).
+
+    The client never touches the clipboard: the caller decides whether to paste it
+    (DictatingApp.deliver) or to hand the path over (IPC).
+    """
+
+
+class _StreamCollector:
+    """Accumulates a streamed response and forwards each text chunk to on_delta."""
+
+    def __init__(self, on_delta):
+        self.on_delta = on_delta
+        self.chunks = []
+        self.last = None
+
+    def add(self, chunk):
+        self.last = chunk
+        if chunk.text:
+            self.chunks.append(chunk.text)
+            self.on_delta(chunk.text)
+
+    def fail(self, error):
+        if self.chunks:
+            # Text already went to the caller: a retry would repeat it
+            raise PartialStreamError(f"Stream interrupted after {len(self.chunks)} chunk(s): {error}") from error
+        raise error
+
+    def response(self):
+        # The last chunk carries the usage metadata of the whole response
+        return SimpleNamespace(
+            text="".join(self.chunks),
+            usage_metadata=getattr(self.last, "usage_metadata", None),
+            model_version=getattr(self.last, "model_version", None),
+        )
+
+
 class GeminiClient:
-    def __init__(self):
+    def __init__(self, spool=None, quota_limits=None, adaptive_budget=True, modes=None, usage_path="usage.json",
+                 image_generation=True):
         # Try to get from env, else fallback (dev mode)
         api_key = os.getenv("GEMINI_API_KEY", "").strip()
         
@@ -21,16 +82,25 @@ class GeminiClient:
         if not api_key:
             raise ValueError("GEMINI_API_KEY introuvable dans l'env")
         
-        print(f"[DEBUG] Using Key: {api_key[:5]}...{api_key[-4:]} (Length: {len(api_key)})")
+        logger.debug("Using Key: %s...%s (Length: %d)", api_key[:5], api_key[-4:], len(api_key))
 
         self.client = genai.Client(api_key=api_key)
+        self.spool = spool
+        self.modes = modes or ModeRegistry.load()
+        self.quota = QuotaScheduler(limits=quota_limits, alternates=FALLBACK_MODELS)
+        self.usage = UsageTracker(usage_path)
+        self.budget = BudgetController() if adaptive_budget else None
+        # False for headless callers (batch, evaluation): no paid Pro-image call
+        self.image_generation = image_generation
+        self.loop = None  # Event loop of the async client, started on the first cancellable call
+        self.loop_lock = threading.Lock()
         
         # System Instruction
         try:
             with open("system_instruction.txt", "r", encoding="utf-8") as f:
                 self.system_instruction = f.read().strip()
         except FileNotFoundError:
-            print("[WARN] Fichier system_instruction.txt introuvable. Utilisation des instructions par défaut.")
+            logger.warning("Fichier system_instruction.txt introuvable. Utilisation des instructions par défaut.")
             self.system_instruction = (
                 "Tu es un assistant vocal invisible pour Windows. "
                 "Ta tâche est de produire EXACTEMENT le texte que l'utilisateur veut écrire. Il est très important de bien écouter l'utilisateur, les captures d'écran n'étant là que pour le contexte."
@@ -38,75 +108,172 @@ class GeminiClient:
             )
         self.model_name = "gemini-2.5-flash-lite" # Optimized for low latency
 
-    def _generate_with_retry(self, model_name, contents, config):
+    def _generate_with_retry(self, model_name, contents, config, on_delta=None, cancel=None):
         """
         Wraps generate_content with retry logic (backoff 1s, 2s, 5s) 
-        and model fallback on 503 errors.
+        and model fallback on 503 errors. Every attempt first reserves quota
+        with the scheduler; 429 errors wait for the server-suggested delay
+        (or switch to the fallback model when that delay is too long).
+        With on_delta, the response is streamed and each text chunk forwarded.
+        A cancel token interrupts quota waits, backoff sleeps and the HTTP call.
         """
         delays = [1, 2, 5]
-        
-        # Fallback map
-        fallback_models = {
-            "gemini-2.5-flash-lite": "gemini-3-flash-preview",
-            "gemini-3-pro-preview": "gemini-2.5-pro",
-        }
+        sleep = cancel.sleep if cancel else time.sleep
 
         current_model = model_name
+        estimated_tokens = self.quota.estimate_tokens(contents, config)
         
         for attempt, delay in enumerate(delays + [None]): # None means last attempt or fallback
+            current_model = self.quota.acquire(current_model, estimated_tokens, sleep)
             try:
-                print(f"[DEBUG] Generating with {current_model} (Attempt {attempt + 1})")
-                response = self.client.models.generate_content(
-                    model=current_model,
-                    contents=contents,
-                    config=config
-                )
+                logger.debug("Generating with %s (attempt %d, ~%d tokens)", current_model, attempt + 1, estimated_tokens)
+                response = self._call_model(current_model, contents, config, on_delta, cancel)
+                self._record_usage(current_model, estimated_tokens, response)
                 return response
             
+            except PartialStreamError:
+                raise
             except Exception as e:
                 error_str = str(e)
+                if is_rate_limit_error(e):
+                    # Quota exceeded: the scheduler blocks the model for the suggested delay
+                    server_delay = parse_retry_delay(e)
+                    wait = server_delay if server_delay is not None else (delay or delays[-1])
+                    logger.warning("Gemini 429/Rate limited on %s (retry in %ss): %s", current_model, wait, e)
+                    self.quota.penalize(current_model, wait)
+
+                    if delay is None and current_model not in FALLBACK_MODELS:
+                        logger.error("Rate limit retries exhausted for %s.", current_model)
+                        raise e
+                    if current_model in FALLBACK_MODELS and (delay is None or wait > self.quota.max_wait):
+                        new_model = FALLBACK_MODELS[current_model]
+                        logger.info("Rate limited. Switching model: %s -> %s", current_model, new_model)
+                        current_model = new_model
+                    # The next acquire() sleeps until the model is unblocked
+                    continue
+
                 # Check for 503 or Overloaded
                 if "503" in error_str or "overloaded" in error_str.lower():
-                    print(f"[WARN] Gemini 503/Overloaded: {e}")
+                    logger.warning("Gemini 503/Overloaded: %s", e)
                     
                     if delay is not None:
                         # Backoff
-                        print(f"[RETRY] Waiting {delay}s before retry...")
-                        time.sleep(delay)
+                        logger.info("Waiting %ss before retry...", delay)
+                        sleep(delay)
                         continue
                     else:
                         # Retries exhausted, try fallback if available
-                        if current_model in fallback_models:
-                            new_model = fallback_models[current_model]
-                            print(f"[FALLBACK] Retries failed. Switching model: {current_model} -> {new_model}")
-                            current_model = new_model
+                        if current_model in FALLBACK_MODELS:
+                            new_model = FALLBACK_MODELS[current_model]
+                            logger.info("Retries failed. Switching model: %s -> %s", current_model, new_model)
+                            current_model = self.quota.acquire(new_model, estimated_tokens, sleep)
                             # Try ONE more time with new model (or could loop again, but let's do one try)
                             try:
-                                print(f"[DEBUG] Generating with fallback {current_model}")
-                                response = self.client.models.generate_content(
-                                    model=current_model,
-                                    contents=contents,
-                                    config=config
-                                )
+                                logger.debug("Generating with fallback %s", current_model)
+                                response = self._call_model(current_model, contents, config, on_delta, cancel)
+                                self._record_usage(current_model, estimated_tokens, response)
                                 return response
                             except Exception as e2:
-                                print(f"[ERROR] Fallback failed: {e2}")
+                                logger.error("Fallback failed: %s", e2)
                                 raise e2
                         else:
                             # No fallback available
-                            print(f"[ERROR] Retries exhausted, no fallback for {current_model}.")
+                            logger.error("Retries exhausted, no fallback for %s.", current_model)
                             raise e
                 else:
                     # Non-retriable error (e.g. 400, 403)
                     raise e
 
-    def _copy_image_to_clipboard_native(self, image_path: str):
+        # Last attempt was rate limited after switching to the fallback model
+        current_model = self.quota.acquire(current_model, estimated_tokens, sleep)
+        logger.debug("Generating with fallback %s", current_model)
+        response = self._call_model(current_model, contents, config, on_delta, cancel)
+        self._record_usage(current_model, estimated_tokens, response)
+        return response
+
+    def _call_model(self, model_name, contents, config, on_delta=None, cancel=None):
+        """One model call. Streams when on_delta is given and returns an equivalent response.
+
+        With a cancel token the call goes through the async client on a background
+        event loop, so that cancelling aborts the HTTP request itself. The loop is
+        shared by all requests: chunks are queued there and on_delta runs on this thread.
+        """
+        if cancel:
+            if not on_delta:
+                return self._run_cancellable(self._call_model_async(model_name, contents, config), cancel)
+            deltas = queue.SimpleQueue()
+            coro = self._call_model_async(model_name, contents, config, deltas.put)
+            return self._run_cancellable(coro, cancel, deltas, on_delta)
+        if not on_delta:
+            return self.client.models.generate_content(model=model_name, contents=contents, config=config)
+        stream = _StreamCollector(on_delta)
+        try:
+            for chunk in self.client.models.generate_content_stream(model=model_name, contents=contents, config=config):
+                stream.add(chunk)
+        except Exception as e:
+            stream.fail(e)
+        return stream.response()
+
+    async def _call_model_async(self, model_name, contents, config, on_delta=None):
+        if not on_delta:
+            return await self.client.aio.models.generate_content(model=model_name, contents=contents, config=config)
+        stream = _StreamCollector(on_delta)
+        try:
+            async for chunk in await self.client.aio.models.generate_content_stream(model=model_name, contents=contents, config=config):
+                stream.add(chunk)
+        except Exception as e:
+            stream.fail(e)
+        return stream.response()
+
+    def _run_cancellable(self, coro, cancel, deltas=None, on_delta=None):
+        """Runs a coroutine on the event loop thread and waits for it; cancel() aborts it at once.
+
+        Text chunks the coroutine puts in deltas are passed to on_delta from the calling
+        thread while waiting, so a slow callback only delays its own request.
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self._event_loop())
+        remove = cancel.on_cancel(future.cancel)
+        try:
+            if deltas is not None:
+                # Queued after the coroutine's last chunk, also when it is cancelled or fails
+                future.add_done_callback(lambda _: deltas.put(None))
+                delivered = 0
+                for text in iter(deltas.get, None):
+                    try:
+                        on_delta(text)
+                    except Exception as e:
+                        future.cancel()
+                        raise PartialStreamError(f"Stream interrupted after {delivered} chunk(s): {e}") from e
+                    delivered += 1
+            return future.result()
+        except concurrent.futures.CancelledError:
+            raise RequestCancelled(cancel.reason)
+        finally:
+            remove()
+
+    def _event_loop(self):
+        with self.loop_lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, daemon=True, name="genai-async").start()
+            return self.loop
+
+    def _record_usage(self, model_name, estimated_tokens, response):
+        """Feeds the real token count back to the quota scheduler."""
+        usage = getattr(response, "usage_metadata", None)
+        actual = getattr(usage, "total_token_count", None) if usage else None
+        self.quota.record_usage(model_name, estimated_tokens, actual)
+
+    def quota_headroom(self) -> dict:
+        return self.quota.headroom()
+
+    def copy_image_to_clipboard(self, image_path: str):
         """Copies an image at the given path to the Windows clipboard using ctypes."""
         try:
-            image = Image.open(image_path)
             output = BytesIO()
-            # Convert to RGB to ensure compatibility
-            image.convert("RGB").save(output, "BMP")
+            # Convert to RGB to ensure compatibility (and close the file handle right away)
+            with Image.open(image_path) as image:
+                image.convert("RGB").save(output, "BMP")
             data = output.getvalue()[14:]  # Remove the 14-byte BMP header to get DIB
             output.close()
 
@@ -146,241 +313,187 @@ class GeminiClient:
             finally:
                 user32.CloseClipboard()
                 
-            print("[INFO] Native Copy to Clipboard success.")
+            logger.info("Native Copy to Clipboard success.")
             
         except Exception as e:
-            print(f"[ERROR] Native Clipboard Copy failed: {e}")
+            logger.error("Native Clipboard Copy failed: %s", e)
             raise e
 
-    def process_audio(self, audio_path: str, image_path: str = None, window_title: str = None, mode: str = "dictation") -> str:
-        """Uploads audio/image bytes and gets the response text."""
-        if mode == "thinking":
-            return self._process_thinking_mode(audio_path, image_path, window_title)
+    def needs_screenshot(self, mode, window_title: str = None) -> bool:
+        """False if the mode takes no screenshot, or the adaptive budget dropped it for this app."""
+        if not mode.captures_screen:
+            return False
+        if mode.adaptive_budget and self.budget and mode.image_level:
+            return self.budget.current_level(mode.name, window_title, mode.image_level) != "NONE"
+        return True
 
-        print(f"Envoi des données à Gemini... (Mode: {mode}, Audio: {audio_path}, Image: {image_path})")
-        
-        contents = []
-        
-        # 0. Define Prompts based on mode
-        if mode == "thinking":
-            # Reflection/Contextual mode
-            system_instruction = (
-                "Tu es un expert en communication contextuelle et un développeur senior. "
-                "Ta mission est de générer du contenu qui s'intègre PARFAITEMENT dans l'application ouverte devant l'utilisateur. "
-                "\n\n"
-                "RÈGLES D'ANALYSE VISUELLE CRITIQUES :"
-                "1. **FOCUS VISUEL (RÈGLE SUPRÊME)** :"
-                "   - Regarde OÙ est le curseur (cercle ROUGE semi-transparent)."
-                "   - L'application active est CELLE SOUS LE CURSEUR. Ignore les autres fenêtres en arrière-plan."
-                "   - Le texte pertinent est celui à proximité immédiate du curseur."
-                "\n"
-                "2. **Détecte la Langue du Contexte (PRIORITÉ ABSOLUE)** :"
-                "   - Regarde le texte DÉJÀ PRÉSENT sous le curseur."
-                "   - Si le contexte est en ANGLAIS -> TU DOIS RÉPONDRE EN ANGLAIS."
-                "\n"
-                "3. **Identifie la Structure** :"
-                "   - Chat vs Email vs Code : Déduit-le de la zone pointée par le curseur."
-                "\n"
-                "4. **Identifie l'Application** :"
-                "   - **IDE** : Si le curseur est dans le code -> Code pur. Si dans le chat -> Conversation."
-                "   - **Email/Messagerie** : Adapte le ton."
-                "\n"
-                "5. **Pas de Bavardage** : Envoie UNIQUEMENT le texte final à taper."
-            )
-            prompt_text = "Instructions: Regarde SOUS le curseur rouge, analyse le contexte (app, langue) et exécute ma demande."
-        elif mode == "debug":
-            # Debug/Analysis mode
-            system_instruction = (
-                "Tu es un diagnostiqueur visuel. "
-                "Ta tâche est de DÉCRIRE ce qui se passe SOUS LE CURSEUR ROUGE. "
-                "1. Quelle application est directement sous le curseur ? "
-                "2. Quel texte lis-tu PROCHE du curseur ? "
-                "3. Le curseur pointe-t-il sur du code, un champ texte, ou un bouton ?"
-                "4. Ignore les fenêtres en arrière-plan."
-            )
-            prompt_text = "Instructions: Focus sur le cercle rouge. Décris le contexte immédiat."
-        else:
-            # Dictation mode (Default)
-            # We strictly reinforce the "Don't chat" rule here
-            system_instruction = (
-                "Tu es un moteur de dictée pur. "
-                "TA SEULE ET UNIQUE TÂCHE est de transcrire ce que dit l'utilisateur pour qu'il puisse l'insérer dans un document. "
-                "RÈGLES CRITIQUES :\n"
-                "1. Si l'utilisateur donne une instruction de formatage ou de langue (ex: 'écris en anglais', 'traduis ça'), NE L'ÉCRIS PAS. APPLIQUE-LA.\n"
-                "2. Ne dis JAMAIS 'Voici le texte', 'D'accord', ou 'Bien sûr'.\n"
-                "3. N'ajoute pas de guillemets au début ou à la fin.\n"
-                "4. Si l'utilisateur hésite (euh...), ignore les hésitations.\n"
-                "5. Le texte final doit être prêt à être collé."
-                "6. Je vais te fournir des captures d'écran pour t'aider à comprendre le contexte (quelle app est utilisée, dans quelle langue est la discussion actuelle, etc). C'est juste du contexte.\n"
-                "7. Ne recopie pas ce qui est dans la capture d'écran, c'est ce qui est dit à l'oral qui est important."
-            )
-            prompt_text = (
-                "Instructions: Écoute l'audio et tape exactement le texte."
-#                "\nIMPORTANT: Priorise l'audio sur le texte visible à l'écran. N'utilise le contexte visuel que pour les noms propres ou références ambigües."
-            )
+    def process_audio(self, audio_path: str, image_path: str = None, window_title: str = None, mode="dictation", request_id: str = None, on_delta=None, cancel=None) -> str:
+        """Uploads audio/image bytes and gets the response text. mode is a registry name or a Mode.
 
-        # 1. Add Text Context
-        if window_title:
-            prompt_text += f"\nContexte Fenêtre: '{window_title}'."
-        if image_path:
-            prompt_text += "\nContexte Visuel: Une capture d'écran est fournie pour le contexte."
-            
-        # 0. Construct List - ORDER MATTERS for Gemini Focus
-        # We put Audio FIRST to prioritize listening in Dictation Mode
-        if audio_path and os.path.exists(audio_path):
-            with open(audio_path, "rb") as f:
-                audio_bytes = f.read()
-            contents.append(types.Part.from_bytes(data=audio_bytes, mime_type="audio/wav"))
-            print("[INFO] Audio file added to contents.")
+        on_delta(text) receives the final text as it is generated (streaming); the
+        return value is still the whole text. Cancelling the cancel token raises
+        RequestCancelled promptly, aborting the call in flight.
+        """
+        mode = self.modes.get(mode) if isinstance(mode, str) else mode
+        if mode.pipeline == "thinking":
+            return self._process_thinking_mode(mode, audio_path, image_path, window_title, request_id, on_delta, cancel)
 
-        # Then Text Prompt
-        contents.append(prompt_text)
+        logger.info("Envoi des données à Gemini...", extra={"mode": mode.name, "audio": audio_path, "image": image_path})
+        step = mode.main
 
-        # Finally Image (so text doesn't get buried)
-        # RESTORING IMAGE with logic constraints:
-        # We lowered resolution to 'LOW' in config to discourage OCR heavy lifting vs Audio
-        if image_path and os.path.exists(image_path):
-            try:
-                with open(image_path, "rb") as f:
-                    image_bytes = f.read()
-                contents.append(types.Part.from_bytes(data=image_bytes, mime_type="image/png"))
-            except Exception as e:
-                print(f"[WARN] Impossible de lire l'image: {e}")
-
-        # Logging
-        print("\n--- [REQUEST SENT TO MODEL] ---")
-        print(f"Model: {self.model_name} | Mode: {mode}")
-        for item in contents:
-            if isinstance(item, str):
-                print(f"Text: {item}")
-            elif hasattr(item, 'mime_type'):
-                print(f"Data Part: {item.mime_type} ({len(item.data)} bytes)")
-        print("-------------------------------\n")
+        # Adaptive image budget: when the screenshot is only context (dictation), its
+        # resolution can be lowered (or the image dropped) per application once probes
+        # show it doesn't change the output.
+        image_level = mode.image_level
+        probe_level = None
+        if mode.adaptive_budget and self.budget and image_level:
+            image_level, probe_level = self.budget.plan(mode.name, window_title, image_level)
+
+        contents = self._build_single_request(step, audio_path, image_path, window_title, image_level)
+
+        # Logging (full prompt only at DEBUG: formatting it costs time on every request)
+        logger.info("Request sent", extra={"model": step.model, "mode": mode.name, "image_level": image_level})
+        if logger.isEnabledFor(logging.DEBUG):
+            for item in contents:
+                if isinstance(item, str):
+                    logger.debug("Text part: %s", item)
+                elif hasattr(item, 'inline_data') and item.inline_data:
+                    logger.debug("Data part: %s (%d bytes)", item.inline_data.mime_type, len(item.inline_data.data))
         
         # Generate
         try:
             response = self._generate_with_retry(
-                model_name=self.model_name,
+                model_name=step.model,
                 contents=contents,
-                config=types.GenerateContentConfig(
-                    system_instruction=system_instruction,
-                    temperature=0.0 if mode == "dictation" else 0.7, # Creative for thinking/debug, strict for dictation
-                    # Lower resolution for dictation to rely less on OCR details
-                    media_resolution=types.MediaResolution.MEDIA_RESOLUTION_LOW if mode == "dictation" else types.MediaResolution.MEDIA_RESOLUTION_HIGH
-                )
+                config=step.config(image_level),
+                on_delta=on_delta,
+                cancel=cancel
             )
+            self.usage.record(mode.name, window_title, response, step.model)
             
             text_response = response.text.strip() if response.text else ""
-            print("\n--- [RESPONSE RECEIVED] ---")
-            print(text_response)
-            print("---------------------------\n")
+            logger.info("Response received", extra={"mode": mode.name, "chars": len(text_response)})
+            logger.debug("Response text: %s", text_response)
+
+            if probe_level and not (cancel and cancel.cancelled):
+                # Replay with a cheaper image in the background; never delays the paste
+                threading.Thread(
+                    target=self._run_budget_probe,
+                    args=(mode, audio_path, image_path, window_title, probe_level, text_response),
+                    daemon=True
+                ).start()
             return text_response
             
         except Exception as e:
             # Better error logging
-            print(f"\n[ERROR GEMINI]: {e}")
+            logger.error("Gemini error: %s", e)
             if "API key expired" in str(e):
-                 print("!!! VOTRE CLÉ API EST EXPIRÉE OU INVALIDE. VEUILLEZ VÉRIFIER LE FICHIER .ENV !!!")
+                 logger.critical("!!! VOTRE CLÉ API EST EXPIRÉE OU INVALIDE. VEUILLEZ VÉRIFIER LE FICHIER .ENV !!!")
             raise e
 
-    def _process_thinking_mode(self, audio_path: str, image_path: str, window_title: str) -> str:
+    def _load_part(self, path: str, mime_type: str):
+        """Reads a file into a Part, or None if missing/unreadable."""
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                return types.Part.from_bytes(data=f.read(), mime_type=mime_type)
+        except Exception as e:
+            logger.warning("Failed to load %s: %s", mime_type, e)
+            return None
+
+    def _build_single_request(self, step, audio_path, image_path, window_title, image_level):
+        """Builds contents for a single-call mode. image_level 'NONE' drops the screenshot."""
+        contents = []
+        image_part = self._load_part(image_path, "image/png") if image_level != "NONE" else None
+
+        # 1. Add Text Context
+        prompt_text = step.prompt
+        if window_title:
+            prompt_text += f"\nContexte Fenêtre: '{window_title}'."
+        if image_part:
+            prompt_text += "\nContexte Visuel: Une capture d'écran est fournie pour le contexte."
+            
+        # 0. Construct List - ORDER MATTERS for Gemini Focus
+        # We put Audio FIRST to prioritize listening in Dictation Mode
+        audio_part = self._load_part(audio_path, "audio/wav")
+        if audio_part:
+            contents.append(audio_part)
+
+        # Then Text Prompt
+        contents.append(prompt_text)
+
+        # Finally Image (so text doesn't get buried)
+        if image_part:
+            contents.append(image_part)
+        return contents
+
+    def _run_budget_probe(self, mode, audio_path, image_path, window_title, probe_level, reference_text):
+        """Sends the same request with a cheaper image level and reports whether the output changed."""
+        try:
+            step = mode.main
+            contents = self._build_single_request(step, audio_path, image_path, window_title, probe_level)
+            response = self._generate_with_retry(model_name=step.model, contents=contents, config=step.config(probe_level))
+            self.usage.record(f"{mode.name}:probe", window_title, response, step.model)
+            candidate = response.text.strip() if response.text else ""
+            self.budget.report(mode.name, window_title, probe_level, reference_text, candidate)
+        except Exception as e:
+            logger.warning("Budget probe %s failed: %s", probe_level, e)
+
+    def _process_thinking_mode(self, mode, audio_path: str, image_path: str, window_title: str, request_id: str = None, on_delta=None, cancel=None) -> str:
         """Executes the two-step thinking process: Analysis -> Drafting."""
-        print("\n=== [THINKING MODE STARTED] ===")
+        logger.info("=== [THINKING MODE STARTED] ===")
+        analysis_step = mode.steps["analysis"]
+        drafting_step = mode.steps["drafting"]
         
         # --- STEP 1: ANALYSIS ---
-        print(">> STEP 1: ANALYZING CONTEXT & INTENT...")
-        
-        analysis_system_instruction = (
-            "Tu es un expert en analyse de contexte et communication. "
-            "Ta mission est d'analyser la situation (écran, audio) pour préparer la réponse parfaite."
-            "\nNAVIGATEUR :"
-            "1. **Analyse Visuelle** : Regarde sous le curseur rouge. Quelle est l'app ? Quel est le ton ?"
-            "2. **Analyse Audio** : Que veut l'utilisateur ?"
-            "3. **Stratégie** : Détermine la langue, le ton (Pro/Perso), et les points clés."
-            "\n4. **ROUTING (CRITIQUE)** : Evalue la complexité."
-            "   - 'COMPLEX' : Code, Raisonnement logique complexe, Créativité longue, ou demande explicite de 'Pro'."
-            "   - 'SIMPLE' : Email rapide, chat, correction, courte phrase."
-            "   - 'IMAGE_GENERATION' : L'utilisateur demande explicitement de générer ou dessiner une image/graphique."
-            "\nSORTIE ATTENDUE :"
-            "Tu dois répondre UNIQUEMENT en JSON avec la structure suivante :"
-            "{"
-            "  \"context_analysis\": \"Analyse visuelle et contextuelle\","
-            "  \"intent\": \"Ce que veut l'utilisateur (Pour IMAGE_GENERATION: le prompt de l'image)\","
-            "  \"language\": \"Langue détectée (ex: 'fr', 'en')\","
-            "  \"tone\": \"Ton suggéré\","
-            "  \"complexity\": \"SIMPLE\" OU \"COMPLEX\" OU \"IMAGE_GENERATION\","
-            "  \"model_reasoning\": \"Pourquoi c'est simple, complexe ou une image\","
-            "  \"step_by_step_plan\": \"Plan de rédaction\""
-            "}"
-        )
+        logger.info(">> STEP 1: ANALYZING CONTEXT & INTENT...")
         
         contents_step1 = []
-        prompt_text_1 = "Instructions: Analyse tout (Audio + Image) et donne-moi le plan de rédaction."
+        prompt_text_1 = analysis_step.prompt
         
         if window_title:
             prompt_text_1 += f"\nContexte Fenêtre: '{window_title}'."
         
         contents_step1.append(prompt_text_1)
         
-        # Helper to load files safely
-        img_part = None
-        if image_path and os.path.exists(image_path):
-            try:
-                with open(image_path, "rb") as f:
-                    img_part = types.Part.from_bytes(data=f.read(), mime_type="image/png")
-                    contents_step1.append(img_part)
-            except Exception as e:
-                print(f"[WARN] Failed to load image: {e}")
-
-        if audio_path and os.path.exists(audio_path):
-            try:
-                with open(audio_path, "rb") as f:
-                    audio_part = types.Part.from_bytes(data=f.read(), mime_type="audio/wav")
-                    contents_step1.append(audio_part)
-            except Exception as e:
-                 print(f"[WARN] Failed to load audio: {e}")
+        img_part = self._load_part(image_path, "image/png") if mode.captures_screen else None
+        if img_part:
+            contents_step1.append(img_part)
+        audio_part = self._load_part(audio_path, "audio/wav")
+        if audio_part:
+            contents_step1.append(audio_part)
 
         try:
             response_1 = self._generate_with_retry(
-                model_name=self.model_name,
+                model_name=analysis_step.model,
                 contents=contents_step1,
-                config=types.GenerateContentConfig(
-                    system_instruction=analysis_system_instruction,
-                    temperature=0.7,
-                    response_mime_type="application/json"
-                )
+                config=analysis_step.config(mode.image_level),
+                cancel=cancel
             )
+            self.usage.record(mode.name, window_title, response_1, analysis_step.model)
             analysis_text = response_1.text.strip() if response_1.text else "{}"
-            print(f"[STEP 1 RAW JSON]:\n{analysis_text}\n")
+            logger.debug("Step 1 raw JSON: %s", analysis_text)
             
             # Parse JSON
             try:
                 analysis_json = json.loads(analysis_text)
             except json.JSONDecodeError:
-                print("[WARN] JSON Parsing failed, falling back to simple text analysis.")
+                logger.warning("JSON Parsing failed, falling back to simple text analysis.")
                 analysis_json = {"complexity": "SIMPLE", "context_analysis": analysis_text}
 
         except Exception as e:
-            print(f"[ERROR] Step 1 failed: {e}")
-            return ""
+            # Raised like single-call errors: callers (batch, IPC) must not take it for an empty answer
+            logger.error("Step 1 failed: %s", e)
+            raise
 
         # --- STEP 2: DRAFTING ---
-        print(">> STEP 2: GENERATING FINAL TEXT...")
-        
-        drafting_system_instruction = (
-            "Tu es un rédacteur expert. "
-            "En te basant sur l'ANALYSE fournie et le contexte visuel, rédige le texte final."
-            "\nRÈGLES :"
-            "1. Respecte scrupuleusement le ton et la langue identifiés."
-            "2. Intègre-toi parfaitement au texte existant (sous le curseur)."
-            "3. SORTIE : UNIQUEMENT le texte à écrire. Pas de guillemets, pas de commentaires."
-        )
+        logger.info(">> STEP 2: GENERATING FINAL TEXT...")
         
         contents_step2 = []
         # Create a nice summary for the drafter
-        prompt_text_2 = (
-            f"CONTEXTE ANALYSÉ :\n{json.dumps(analysis_json, indent=2, ensure_ascii=False)}\n\n"
-            "Instructions: Rédige maintenant le texte final en suivant STRICTEMENT ce plan."
+        prompt_text_2 = drafting_step.prompt.replace(
+            "{analysis}", json.dumps(analysis_json, indent=2, ensure_ascii=False)
         )
         
         contents_step2.append(prompt_text_2)
@@ -389,54 +502,56 @@ class GeminiClient:
             contents_step2.append(img_part)
         
         # Determine Model for Step 2
-        step2_model = self.model_name # Default to Lite
+        step2_model = drafting_step.model # Default to Lite
         try:
             complexity = analysis_json.get("complexity", "SIMPLE").upper()
         except:
             complexity = "SIMPLE"
         
         if complexity == "COMPLEX":
-            step2_model = "gemini-3-pro-preview"
-            print(f"[ROUTING] Task judged COMPLEX ({analysis_json.get('model_reasoning')}). Switching to {step2_model}.")
-        elif complexity == "IMAGE_GENERATION":
+            step2_model = drafting_step.spec.get("complex_model", step2_model)
+            logger.info("Task judged COMPLEX (%s). Switching to %s.", analysis_json.get('model_reasoning'), step2_model)
+        elif complexity == "IMAGE_GENERATION" and "image" in mode.steps and not self.image_generation:
+            logger.info("Task judged IMAGE_GENERATION but image generation is disabled. Drafting text on %s.", step2_model)
+        elif complexity == "IMAGE_GENERATION" and "image" in mode.steps:
              # New Image Mode
-             print(f"[ROUTING] Task judged IMAGE_GENERATION. Switching to Image Generation Flow.")
-             return self._generate_and_copy_image(analysis_json.get("intent")) # Use intent as prompt
+             logger.info("Task judged IMAGE_GENERATION. Switching to Image Generation Flow.")
+             return self._generate_image(analysis_json.get("intent"), request_id, mode, cancel) # Use intent as prompt
         else:
-            print(f"[ROUTING] Task judged SIMPLE. Staying on {step2_model}.")
+            logger.info("Task judged SIMPLE. Staying on %s.", step2_model)
 
         try:
             response_2 = self._generate_with_retry(
                 model_name=step2_model,
                 contents=contents_step2,
-                config=types.GenerateContentConfig(
-                    system_instruction=drafting_system_instruction,
-                    temperature=0.7
-                )
+                config=drafting_step.config(mode.image_level),
+                on_delta=on_delta,
+                cancel=cancel
             )
+            self.usage.record(mode.name, window_title, response_2, step2_model)
             final_text = response_2.text.strip() if response_2.text else ""
-            print(f"[STEP 2 OUTPUT]:\n{final_text}\n")
-            print("=== [THINKING MODE COMPLETE] ===")
+            logger.debug("Step 2 output: %s", final_text)
+            logger.info("=== [THINKING MODE COMPLETE] ===", extra={"model": step2_model, "chars": len(final_text)})
             return final_text
             
         except Exception as e:
-            print(f"[ERROR] Step 2 failed: {e}")
-            return ""
+            logger.error("Step 2 failed: %s", e)
+            raise
 
-    def _generate_and_copy_image(self, prompt: str) -> str:
-        """Generates an image using Gemini and copies it to the clipboard using native ctypes."""
-        print(f"\n>> GENERATING IMAGE for prompt: '{prompt}'...")
+    def _generate_image(self, prompt: str, request_id: str = None, mode=None, cancel=None) -> GeneratedImage:
+        """Generates an image using Gemini and saves it to the spool (see GeneratedImage)."""
+        logger.info(">> GENERATING IMAGE for prompt: '%s'...", prompt)
         
+        image_step = (mode or self.modes.get("thinking")).steps["image"]
         try:
-            # 1. Generate Image
+            # 1. Generate Image (config enables search for grounding: weather, etc)
             response = self._generate_with_retry(
-                model_name="gemini-3-pro-image-preview",
+                model_name=image_step.model,
                 contents=prompt,
-                config=types.GenerateContentConfig(
-                    response_modalities=['Image'],
-                    tools=[{"google_search": {}}] # Enable search for grounding (weather, etc)
-                )
+                config=image_step.config(),
+                cancel=cancel
             )
+            self.usage.record("thinking:image", None, response, image_step.model)
             
             # 2. Extract and Save Image
             image_saved = False
@@ -444,24 +559,23 @@ class GeminiClient:
             
             for part in response.parts:
                 if image := part.as_image():
-                     # Create temp file
-                     fd, temp_path = tempfile.mkstemp(suffix=".png")
-                     os.close(fd)
+                     # Create target file (spool keeps it bounded, temp files would leak)
+                     if self.spool:
+                         temp_path = self.spool.allocate(request_id, "generated", ".png")
+                     else:
+                         fd, temp_path = tempfile.mkstemp(suffix=".png")
+                         os.close(fd)
                      image.save(temp_path)
-                     print(f"[INFO] Image saved to {temp_path}")
+                     if self.spool:
+                         temp_path = self.spool.commit(temp_path, meta={"prompt": prompt})
+                     logger.info("Image saved to %s", temp_path)
                      image_saved = True
                      break
             
             if not image_saved:
-                print("[ERROR] No image returned by Gemini.")
-                return ""
-
-            # 3. Copy to Clipboard (Native Code)
-            print("[INFO] Copying to clipboard (Native)...")
-            self._copy_image_to_clipboard_native(temp_path)
-            
-            return "___IMAGE_GENERATED___"
+                raise RuntimeError("No image returned by Gemini")
+            return GeneratedImage(temp_path)
 
         except Exception as e:
-            print(f"[ERROR] Image Generation failed: {e}")
-            return ""
+            logger.error("Image Generation failed: %s", e)
+            raise
@@ -1,6 +1,7 @@
 import keyboard
 import time
 import os
+import logging
 import threading
 import sys
 import winreg
@@ -12,14 +13,27 @@ import pyperclip
 from dotenv import load_dotenv
 
 from recorder import AudioRecorder
-from llm_client import GeminiClient
-from context_provider import ContextProvider
+from llm_client import GeminiClient, GeneratedImage
+from context_provider import ContextProvider, UNKNOWN_WINDOW_TITLES
+from spool import Spool
+from modes import ModeRegistry
+from segmenter import LongFormSession
+from cancellation import CancelToken, RequestCancelled
+from report_cache import ReportCache
+from audio_conditioning import settings_for
+from quota import IMAGE_TOKENS_BY_RESOLUTION
+from app_logging import dump_recent, setup_logging, stop_logging
+from ipc import InstanceLock, IpcServer
+import diagnostics
+
+logger = logging.getLogger(__name__)
 
 load_dotenv(override=True)
 
-HOTKEY = os.getenv("HOTKEY", "F8")
 APP_NAME = "Gemini Dictating Agent"
 ICON_PATH = "icon.png"
+DEFAULT_TRIGGER_SECONDS = 5  # Recording length of an audio mode triggered through IPC
+MAX_TRIGGER_SECONDS = 120
 
 class DictatingApp:
     def __init__(self):
@@ -27,146 +41,382 @@ class DictatingApp:
         self.client = None
         self.recorder = None
         self.context_provider = None
+        self.spool = None
+        self.modes = None
         self.icon = None
         self.current_mic_index = None
         self.config_file = "config.json"
+        self.recorder_lock = threading.Lock()  # Hotkeys and IPC triggers share the microphone
+        self.instance_lock = InstanceLock()
+        self.ipc = None
+        self.started_at = time.time()
+        self.retrigger_delay = 0.5
+        self.inflight = {}  # request id -> (window title, CancelToken, source: "hotkey" or "ipc")
+        self.inflight_lock = threading.Lock()
+        self.deliver_lock = threading.Lock()  # One paste at a time: clipboard + Ctrl+V
+        self.cancel_hotkey = os.getenv("HOTKEY_CANCEL", "esc")
+        self.report_caches = {}  # mode name -> ReportCache
 
     def setup_components(self):
         try:
-            self.client = GeminiClient()
-            self.recorder = AudioRecorder()
-            self.context_provider = ContextProvider()
-            print("[INFO] Components initialized.")
+            spool_config = self.load_config().get("spool", {})
+            self.spool = Spool(
+                root=spool_config.get("dir"),
+                max_bytes=int(spool_config.get("max_mb", 500) * 1024 * 1024),
+                max_age_days=spool_config.get("max_age_days", 7)
+            )
+            logger.info("Spool: %s (%s KB used)", self.spool.root, self.spool.total_bytes() // 1024)
+            self.modes = ModeRegistry.load(self.load_config().get("modes_dir"))
+            self.client = GeminiClient(
+                spool=self.spool,
+                modes=self.modes,
+                quota_limits=self.load_config().get("quota"),
+                adaptive_budget=self.load_config().get("adaptive_budget", True)
+            )
+            self.recorder = AudioRecorder(spool=self.spool)
+            self.context_provider = ContextProvider(spool=self.spool)
+            logger.info("Components initialized.")
             return True
         except Exception as e:
-            print(f"[ERROR] Init failed: {e}")
+            logger.error("Init failed: %s", e)
             return False
 
     def listen_loop(self):
-        HOTKEY_THINKING = os.getenv("HOTKEY_THINKING", "F9")
-        HOTKEY_DEBUG = "ctrl+f9"
-        
-        print(f"[INFO] Listening for Dictation ({HOTKEY}), Thinking ({HOTKEY_THINKING}), and Debug ({HOTKEY_DEBUG})...")
+        hotkey_modes = self.modes.by_hotkey()
+        logger.info("Listening for %s...", ', '.join(f'{m.label} ({m.hotkey})' for m in hotkey_modes))
         
         while self.running:
             try:
+                # The cancel key aborts hotkey requests still being processed (only then: Esc stays
+                # usable); IPC requests belong to their client, which cancels them itself
+                if self.has_inflight("hotkey") and keyboard.is_pressed(self.cancel_hotkey):
+                    self.cancel(source="hotkey", reason="cancel key")
+                    while keyboard.is_pressed(self.cancel_hotkey):
+                        time.sleep(0.05)
+                    continue
+
+                # Intelligent Polling: combinations are checked first, so Ctrl+F9 is not taken for F9
                 active_mode = None
-                pressed_key = None
-                
-                # Intelligent Polling
-                if keyboard.is_pressed(HOTKEY):
-                    active_mode = "dictation"
-                    pressed_key = HOTKEY
-                elif keyboard.is_pressed(HOTKEY_THINKING):
-                    # Check if it is actually DEBUG (Ctrl+F9)
-                    if keyboard.is_pressed(HOTKEY_DEBUG):
-                         active_mode = "debug"
-                         pressed_key = HOTKEY_DEBUG
-                    else:
-                         active_mode = "thinking"
-                         pressed_key = HOTKEY_THINKING
-                elif keyboard.is_pressed(HOTKEY_DEBUG): # Fallback check
-                    active_mode = "debug"
-                    pressed_key = HOTKEY_DEBUG
+                for mode in hotkey_modes:
+                    if keyboard.is_pressed(mode.hotkey):
+                        active_mode = mode
+                        break
                 
                 if not active_mode:
                     time.sleep(0.05)
                     continue
 
-                print(f"\n[EVENT] Key {pressed_key} pressed ({active_mode}).")
+                pressed_key = active_mode.hotkey
+                request_id = Spool.new_request_id()
+                logger.info("Key %s pressed (%s). Request %s", pressed_key, active_mode.name, request_id)
                 
-                # Context capture (Always needed)
-                print("[INFO] Context capture...")
-                try:
-                    window_title = self.context_provider.get_active_window_title()
-                    image_path = self.context_provider.capture_screen_with_cursor()
-                except Exception as e:
-                    print(f"[WARN] Context error: {e}")
-                    window_title = None
-                    image_path = None
-                    
-                # Handle Debug Mode (No Audio needed, just Screenshot analysis)
-                if active_mode == "debug":
+                # Modes without audio (Debug): just the screenshot analysis
+                if not active_mode.needs_audio:
+                     capture = {}
+                     window_title, image_path = self.capture_context(active_mode, request_id, capture)
+                     token = self.track(request_id, window_title)
                      # Wait for release to avoid multiple triggers
-                     while keyboard.is_pressed("f9") or keyboard.is_pressed("ctrl"): # Simple debounce
+                     while any(keyboard.is_pressed(key) for key in pressed_key.split("+")): # Simple debounce
                          time.sleep(0.1)
 
-                     print("[DEBUG] Analyzing screenshot...")
-                     try:
-                        # We pass None for audio_path
-                        text = self.client.process_audio(audio_path=None, image_path=image_path, window_title=window_title, mode="debug")
-                        print(f"[DEBUG REPORT]\n{text}\n")
-                        # We do NOT paste the debug text, just print to console for User to see
-                     except Exception as e:
-                        print(f"[ERROR] Debug analysis failed: {e}")
-                     
-                     # Cleanup image
-                     if image_path and os.path.exists(image_path):
-                        os.remove(image_path)
+                     self.spool.annotate(request_id, mode=active_mode.name, window_title=window_title)
+                     logger.info("[%s] Analyzing screenshot...", active_mode.name.upper())
+                     # We pass None for audio_path. The screenshot stays in the spool (bounded) for replay
+                     self.dispatch(active_mode, request_id, token, None, image_path, window_title, capture=capture)
                      continue # Loop back
 
-                # Start recording for Voice Modes
-                print(f"[MAIN] Starting recording on device index: {self.current_mic_index}")
-                self.recorder.start(device_index=self.current_mic_index)
-
-                # Wait for release of the specific key
-                # Note: For complex keys like ctrl+f9, simple wait might be tricky, but here we are in voice mode (F8/F9)
-                while self.running and keyboard.is_pressed(pressed_key):
-                    time.sleep(0.05)
-                
-                print(f"[MAIN] Key {pressed_key} released. Stopping recorder...")
-                audio_path = self.recorder.stop()
-                print(f"[MAIN] Audio path received: {audio_path}")
+                # An IPC trigger can hold the microphone for up to MAX_TRIGGER_SECONDS: don't wait
+                # for it, this loop also polls the cancel key
+                if not self.recorder_lock.acquire(blocking=False):
+                    logger.warning("Microphone busy (remote recording in progress): %s ignored.", pressed_key)
+                    while self.running and keyboard.is_pressed(pressed_key):
+                        time.sleep(0.05)
+                    continue
+                try:
+                    token, window_title, image_path, session, audio_path = self.record(active_mode, request_id, pressed_key)
+                finally:
+                    self.recorder_lock.release()
+                logger.info("Audio path received: %s", audio_path)
                 
                 if audio_path:
-                    try:
-                        print(f"[MAIN] Sending to LLM (Mode: {active_mode})...")
-                        text = self.client.process_audio(audio_path, image_path, window_title, mode=active_mode)
-                        print(f"[MAIN] LLM returned text length: {len(text) if text else 0}")
-                        
-                        if text:
-                            # Check for special Image Generation signal
-                            if text == "___IMAGE_GENERATED___":
-                                print("[INFO] Image generated. Triggering Paste...")
-                                # Image is already in clipboard via llm_client
-                                time.sleep(0.1)
-                                keyboard.send('ctrl+v')
-                            else:
-                                # Normal Text Flow
-                                pyperclip.copy(text)
-                                time.sleep(0.1)
-                                keyboard.send('ctrl+v')
-                                print("[MAIN] Text pasted.")
-                        else:
-                             print("[MAIN] LLM returned empty text.")
-                    except Exception as e:
-                        print(f"[ERROR] processing: {e}")
-                    
-                    # Cleanup
-                    try:
-                        # DEBUG: Keep audio file for user verification
-                        # os.remove(audio_path)
-                        if image_path and os.path.exists(image_path):
-                            os.remove(image_path)
-                    except: pass
+                    # No cleanup: audio and screenshot stay in the spool, which evicts by size/age
+                    self.dispatch(active_mode, request_id, token, audio_path, image_path, window_title, session)
                 else:
-                    print("[WARN] No audio recorded (file path is None). Mic issue?")
+                    self.untrack(request_id)
+                    if session:
+                        session.finish()
+                    logger.warning("No audio recorded (file path is None). Mic issue?")
                 
                 # Prevent accidental re-trigger immediately after
-                time.sleep(0.5)
+                time.sleep(self.retrigger_delay)
                 
             except Exception as e:
-                print(f"[ERROR] Loop error: {e}")
+                logger.error("Loop error: %s", e)
                 time.sleep(1)
 
-    def on_restart(self, icon, item):
-        print("[INFO] Restarting application...")
+    def record(self, mode, request_id, pressed_key):
+        """Captures the context and records while the hotkey is held (caller holds recorder_lock)."""
+        window_title, image_path = self.capture_context(mode, request_id)
+
+        # Dictating again in the same window replaces the previous request: don't paste it
+        if window_title:
+            self.cancel(window_title=window_title, reason="superseded")
+        token = self.track(request_id, window_title)
+
+        # Long dictations are cut and transcribed while still recording
+        session = None
+        if mode.segmented:
+            session = LongFormSession(self.client, mode, self.recorder, request_id, window_title, image_path, cancel=token)
+
+        # Start recording for Voice Modes
+        logger.info("Starting recording on device index: %s", self.current_mic_index)
+        self.recorder.start(device_index=self.current_mic_index, on_chunk=session.feed if session else None)
+        # After start: nothing between the key press and the first recorded sample
+        self.spool.annotate(request_id, mode=mode.name, window_title=window_title)
+
+        # Wait for release of the specific key
+        while self.running and keyboard.is_pressed(pressed_key):
+            time.sleep(0.05)
+
+        logger.info("Key %s released. Stopping recorder...", pressed_key)
+        audio_path = self.recorder.stop(request_id)
+        return token, window_title, image_path, session, audio_path
+
+    def dispatch(self, mode, request_id, token, audio_path, image_path, window_title, session=None, capture=None):
+        """Processes a request on its own thread, so hotkeys (and the cancel key) stay live meanwhile."""
+        threading.Thread(
+            target=self.process_request,
+            args=(mode, request_id, token, audio_path, image_path, window_title, session, capture),
+            daemon=True,
+            name=f"request-{request_id}"
+        ).start()
+
+    def process_request(self, mode, request_id, token, audio_path, image_path, window_title, session=None, capture=None):
+        capture = capture or {}
+        cache = self.report_cache(mode)
+        try:
+            started = time.perf_counter()
+            # Report modes: the same screen region in the same window gets the same report
+            text = cache.get(window_title, capture.get("fingerprint")) if cache else None
+            cached = text is not None
+            if cached:
+                logger.info("[%s] Same screen as a recent request: reusing its report.", mode.name.upper())
+            elif session:
+                # The full recording stays in the spool; only the segments are sent
+                text = session.finish()
+            else:
+                logger.info("Sending to LLM (Mode: %s)...", mode.name)
+                text = self.client.process_audio(audio_path, image_path, window_title, mode=mode, request_id=request_id, cancel=token)
+                if cache:
+                    cache.put(window_title, capture.get("fingerprint"), text)
+            model_ms = (time.perf_counter() - started) * 1000
+            # Cancelled while the answer was already on its way back: still don't paste it
+            token.raise_if_cancelled()
+            logger.info("LLM returned text length: %s", len(text) if text else 0)
+            self.spool.annotate(request_id, text=text, cached=cached)
+            self.deliver(mode, text, window_title)
+            if not mode.paste and capture.get("stages_ms"):
+                logger.info(self.describe_capture(mode, capture, model_ms, cached))
+        except RequestCancelled as e:
+            logger.info("Request %s cancelled (%s). Nothing pasted.", request_id, e)
+            self.spool.annotate(request_id, cancelled=str(e))
+        except Exception as e:
+            logger.error("%s processing failed: %s", mode.name, e)
+        finally:
+            self.untrack(request_id)
+
+    def report_cache(self, mode):
+        """The mode's ReportCache, if its spec has a "report_cache" block."""
+        spec = mode.spec.get("report_cache")
+        if not spec:
+            return None
+        if mode.name not in self.report_caches:
+            self.report_caches[mode.name] = ReportCache(spec.get("ttl_sec", 600), spec.get("max_distance", 4))
+        return self.report_caches[mode.name]
+
+    def describe_capture(self, mode, capture, model_ms, cached):
+        """How the screenshot was produced and sent: per-stage timings, sizes, image tokens."""
+        stages = capture["stages_ms"]
+        width, height = capture["size"]
+        tokens = IMAGE_TOKENS_BY_RESOLUTION.get(mode.image_level, "?")
+        answer = "cached report" if cached else f"model {model_ms:.0f} ms"
+        return (
+            f"[{mode.name.upper()} PIPELINE] capture {width}x{height} in {sum(stages.values()):.0f} ms "
+            f"({', '.join(f'{name} {ms:.0f}' for name, ms in stages.items())} ms) -> PNG {capture['png_bytes'] // 1024} KB, "
+            f"sent at {mode.image_level} (~{tokens} image tokens); {answer}"
+        )
+
+    def track(self, request_id, window_title=None, source="hotkey") -> CancelToken:
+        """Registers an in-flight request; the returned token is how it gets cancelled."""
+        token = CancelToken()
+        with self.inflight_lock:
+            self.inflight[request_id] = (window_title, token, source)
+        return token
+
+    def untrack(self, request_id):
+        with self.inflight_lock:
+            self.inflight.pop(request_id, None)
+
+    def has_inflight(self, source=None) -> bool:
+        with self.inflight_lock:
+            return any(source in (None, entry[2]) for entry in self.inflight.values())
+
+    def cancel(self, request_id=None, window_title=None, reason="cancelled", source=None):
+        """Cancels in-flight requests: one, those of a window or a source, or all. Returns their ids."""
+        with self.inflight_lock:
+            targets = [(rid, token) for rid, (title, token, origin) in self.inflight.items()
+                       if request_id in (None, rid) and window_title in (None, title) and source in (None, origin)]
+        for rid, token in targets:
+            logger.info("Cancelling request %s (%s)", rid, reason)
+            token.cancel(reason)
+        return [rid for rid, _ in targets]
+
+    def capture_context(self, mode, request_id, stats=None):
+        """Active window title and, if the mode uses it, the screenshot (stats: see capture_screen_with_cursor)."""
+        logger.info("Context capture...")
+        window_title = None
+        image_path = None
+        try:
+            window_title = self.context_provider.get_active_window_title()
+            # Checked before grabbing: capture, overlay and PNG encoding run on the hotkey thread
+            if self.client.needs_screenshot(mode, window_title):
+                cache_spec = mode.spec.get("report_cache")
+                fingerprint_px = cache_spec.get("crop_px", 512) if cache_spec else None
+                image_path = self.context_provider.capture_screen_with_cursor(request_id, stats, fingerprint_px)
+            elif mode.captures_screen:
+                logger.info("Screenshot skipped: not needed by this mode in this app (adaptive budget).")
+        except Exception as e:
+            logger.warning("Context error: %s", e)
+        return window_title, image_path
+
+    def trigger(self, mode_name, seconds=None, on_delta=None, paste=True):
+        """Runs a mode as if its hotkey was pressed (IPC). Audio modes record for `seconds`."""
+        mode = self.modes.get(mode_name)
+        request_id = Spool.new_request_id()
+        logger.info("Mode %s triggered remotely. Request %s", mode.name, request_id)
+        window_title, image_path = self.capture_context(mode, request_id)
+        self.spool.annotate(request_id, mode=mode.name, window_title=window_title, source="ipc")
+
+        token = self.track(request_id, window_title, source="ipc")
+        try:
+            audio_path = None
+            if mode.needs_audio:
+                if not self.recorder_lock.acquire(blocking=False):
+                    raise RuntimeError("Microphone busy (recording in progress)")
+                try:
+                    self.recorder.start(device_index=self.current_mic_index)
+                    token.event.wait(min(seconds or DEFAULT_TRIGGER_SECONDS, MAX_TRIGGER_SECONDS))
+                    audio_path = self.recorder.stop(request_id)
+                finally:
+                    self.recorder_lock.release()
+                token.raise_if_cancelled()
+                if not audio_path:
+                    raise RuntimeError("No audio recorded")
+
+            text = self.client.process_audio(audio_path, image_path, window_title, mode=mode, request_id=request_id, on_delta=on_delta, cancel=token)
+            token.raise_if_cancelled()
+        finally:
+            self.untrack(request_id)
+        self.spool.annotate(request_id, text=text)
+        if paste:
+            self.deliver(mode, text, window_title)
+        return request_id, text
+
+    def status(self) -> dict:
+        """Snapshot for the IPC 'status' command."""
+        with self.inflight_lock:
+            in_flight = list(self.inflight)
+        return {
+            "pid": os.getpid(),
+            "uptime_s": round(time.time() - self.started_at),
+            "recording": self.recorder_lock.locked(),
+            "in_flight": in_flight,
+            "microphone": self.load_config().get("microphone"),
+            "modes": {mode.name: mode.hotkey for mode in self.modes.modes.values()},
+            "quota": self.client.quota_headroom(),
+            "tokens": self.client.usage.grand_total(),
+            "spool_bytes": self.spool.total_bytes(),
+        }
+
+    def deliver(self, mode, text, window_title=None):
+        """Pastes the result into the active app, or prints it for report modes (Debug).
+
+        window_title is the window active when the request started: if focus has moved
+        since, the result is logged instead of being pasted into the wrong app.
+        """
+        if not text:
+            logger.info("LLM returned empty text.")
+            return
+        if not mode.paste:
+            # We do NOT paste the report, just print to console for User to see
+            logger.info("[%s REPORT]\n%s", mode.name.upper(), text)
+            return
+        # Requests finish on their own threads: one clipboard write + Ctrl+V at a time
+        with self.deliver_lock:
+            if window_title and window_title not in UNKNOWN_WINDOW_TITLES:
+                active_title = self.context_provider.get_active_window_title()
+                if active_title not in UNKNOWN_WINDOW_TITLES and active_title != window_title:
+                    logger.warning("Focus moved from '%s' to '%s': result not pasted.\n%s", window_title, active_title, text)
+                    return
+            if isinstance(text, GeneratedImage):
+                logger.info("Image generated. Triggering Paste...")
+                self.client.copy_image_to_clipboard(text)
+                time.sleep(0.1)
+                keyboard.send('ctrl+v')
+            else:
+                # Normal Text Flow
+                pyperclip.copy(text)
+                time.sleep(0.1)
+                keyboard.send('ctrl+v')
+                logger.info("Text pasted.")
+
+    def show_quota(self, icon, item):
+        logger.info("Current headroom (per minute):")
+        for model, room in self.client.quota_headroom().items():
+            blocked = f", blocked {room['blocked_for']}s" if room["blocked_for"] else ""
+            logger.info("  %s: %s/%s req, %s/%s tokens%s", model, room['rpm_left'], room['rpm_limit'],
+                        room['tpm_left'], room['tpm_limit'], blocked)
+
+    def show_usage(self, icon, item):
+        logger.info("Tokens per mode:")
+        for mode, totals in self.client.usage.summary("mode").items():
+            logger.info("  %s: %s req, prompt %s (audio %s, image %s, text %s), output %s", mode, totals['requests'],
+                        totals['prompt'], totals['audio'], totals['image'], totals['text'], totals['output'])
+        if self.client.budget:
+            logger.info("Image level per mode|app:")
+            for key, level in self.client.budget.levels().items():
+                logger.info("  %s: %s", key, level)
+
+    def show_diagnostics(self, icon, item):
+        """Logs memory/handle/thread counts (set PYTHONTRACEMALLOC=5 to also get the traced heap)."""
+        logger.info("Diagnostics: %s", diagnostics.format_sample(diagnostics.sample()))
+
+    def show_logs(self, icon, item):
+        """Opens the last log lines (kept in memory, also when running under pythonw)."""
+        path = dump_recent()
+        try:
+            os.startfile(path)
+        except Exception as e:
+            logger.error("Cannot open %s: %s", path, e)
+
+    def shutdown(self):
         self.running = False
+        if self.ipc:
+            self.ipc.stop()
+        self.client.usage.flush()
+        self.spool.flush()
+        # Released before a restart, or the new process would find it taken
+        self.instance_lock.release()
+
+    def on_restart(self, icon, item):
+        logger.info("Restarting application...")
+        self.shutdown()
+        stop_logging()
         icon.stop()
         os.execl(sys.executable, sys.executable, *sys.argv)
 
     def on_quit(self, icon, item):
-        self.running = False
+        self.shutdown()
         icon.stop()
         sys.exit()
 
@@ -190,9 +440,20 @@ class DictatingApp:
             if name == item.text:
                 self.current_mic_index = idx
                 self.save_config("microphone", name)
-                print(f"[INFO] Microphone switched to: {name} (ID: {idx})")
+                self.apply_audio_conditioning(name)
+                logger.info("Microphone switched to: %s (ID: %s)", name, idx)
                 break
     
+    def apply_audio_conditioning(self, mic_name):
+        """Loads the conditioning settings of this microphone (config.json "audio_conditioning")."""
+        settings = settings_for(self.load_config(), mic_name)
+        self.recorder.conditioning = settings
+        if settings.get("enabled", True):
+            logger.info("Audio conditioning: high-pass %s Hz, normalize %s, soft clip %s, gate %s",
+                        settings['highpass_hz'], settings['normalize'], settings['soft_clip'], settings['gate_db'])
+        else:
+            logger.debug("Audio conditioning off for this microphone.")
+
     def is_mic_checked(self, item):
         # Check if this item matches current config
         config = self.load_config()
@@ -213,16 +474,16 @@ class DictatingApp:
                 script_path = os.path.abspath(__file__)
                 cmd = f'"{python_exe}" "{script_path}"'
                 winreg.SetValueEx(key, APP_NAME, 0, winreg.REG_SZ, cmd)
-                print("[INFO] Added to startup.")
+                logger.info("Added to startup.")
             else:
                 try:
                     winreg.DeleteValue(key, APP_NAME)
-                    print("[INFO] Removed from startup.")
+                    logger.info("Removed from startup.")
                 except FileNotFoundError:
                     pass
             winreg.CloseKey(key)
         except Exception as e:
-            print(f"[ERROR] Startup toggle failed: {e}")
+            logger.error("Startup toggle failed: %s", e)
 
     def is_startup_enabled(self):
         key_path = r"Software\Microsoft\Windows\CurrentVersion\Run"
@@ -241,9 +502,22 @@ class DictatingApp:
         self.set_startup(new_state)
 
     def run(self):
+        # A second listener would fight over the same hotkeys
+        if not self.instance_lock.acquire():
+            logger.warning("%s is already running; use the local API instead (python ipc.py status).", APP_NAME)
+            return
+
         if not self.setup_components():
             return
 
+        ipc_config = self.load_config().get("ipc", {})
+        if ipc_config.get("enabled", True):
+            try:
+                self.ipc = IpcServer(self, port=ipc_config.get("port", 0))
+                self.ipc.start()
+            except Exception as e:
+                logger.error("IPC server failed to start: %s", e)
+
         # Start listener thread
         t = threading.Thread(target=self.listen_loop, daemon=True)
         t.start()
@@ -265,9 +539,11 @@ class DictatingApp:
             for idx, name in devices:
                 if name == saved_mic_name:
                     self.current_mic_index = idx
-                    print(f"[INFO] Restored microphone: {name} (ID: {idx})")
+                    logger.info("Restored microphone: %s (ID: %s)", name, idx)
                     break
         
+        self.apply_audio_conditioning(saved_mic_name)
+
         # Build Mic Menu Items
         mic_items = []
         for idx, name in devices:
@@ -277,14 +553,19 @@ class DictatingApp:
         menu = pystray.Menu(
             item('Microphone', pystray.Menu(*mic_items)),
             item('Start with Windows', self.toggle_startup, checked=lambda item: self.is_startup_enabled()),
+            item('Quota Status', self.show_quota),
+            item('Token Usage', self.show_usage),
+            item('Diagnostics', self.show_diagnostics),
+            item('Show Logs', self.show_logs),
             item('Restart', self.on_restart),
             item('Quit', self.on_quit)
         )
 
         self.icon = pystray.Icon(APP_NAME, image, APP_NAME, menu)
-        print("[INFO] System Tray Icon started.")
+        logger.info("System Tray Icon started.")
         self.icon.run()
 
 if __name__ == "__main__":
+    setup_logging()
     app = DictatingApp()
     app.run()
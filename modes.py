@@ -0,0 +1,174 @@
+import glob
+import json
+import logging
+import os
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+from google.genai import types
+
+from usage import IMAGE_LEVELS
+
+logger = logging.getLogger(__name__)
+
+MODES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modes")
+PIPELINES = ("single", "thinking")
+
+# Keys of a step spec passed straight to GenerateContentConfig
+CONFIG_KEYS = ("temperature", "response_mime_type", "response_modalities", "tools")
+# Keys describing one model call: top level in single-call modes, under "steps" otherwise
+STEP_KEYS = ("model", "complex_model", "prompt", "system_instruction", *CONFIG_KEYS)
+
+
+def _build_config(spec: dict, image_level: Optional[str]) -> types.GenerateContentConfig:
+    kwargs = {key: spec[key] for key in CONFIG_KEYS if key in spec}
+    if spec.get("system_instruction"):
+        kwargs["system_instruction"] = spec["system_instruction"]
+    if image_level in ("HIGH", "MEDIUM", "LOW"):
+        kwargs["media_resolution"] = getattr(types.MediaResolution, f"MEDIA_RESOLUTION_{image_level}")
+    return types.GenerateContentConfig(**kwargs)
+
+
+@dataclass(frozen=True)
+class Step:
+    """One model call of a mode's pipeline, with its request configs built once."""
+    name: str
+    model: str
+    prompt: str
+    # Image level (None = model default) -> GenerateContentConfig. Shared, never mutate.
+    configs: Mapping[Optional[str], types.GenerateContentConfig]
+    spec: Mapping
+
+    def config(self, image_level: Optional[str] = None) -> types.GenerateContentConfig:
+        return self.configs[image_level]
+
+
+@dataclass(frozen=True)
+class Mode:
+    name: str
+    label: str
+    hotkey: Optional[str]
+    pipeline: str
+    needs_audio: bool
+    paste: bool
+    image_level: Optional[str]   # "HIGH" / "MEDIUM" / "LOW", "NONE" = no screenshot, None = model default
+    adaptive_budget: bool
+    segmented: bool              # Long-form: transcribed in VAD-cut segments while recording
+    steps: Mapping[str, Step]
+    spec: Mapping
+
+    @property
+    def main(self) -> Step:
+        return self.steps["main"]
+
+    @property
+    def captures_screen(self) -> bool:
+        return self.image_level != "NONE"
+
+
+def build_mode(spec: dict) -> Mode:
+    """Validates a mode spec (the content of a modes/*.json file) and precomputes its configs."""
+    name = spec["name"]
+    pipeline = spec.get("pipeline", "single")
+    if pipeline not in PIPELINES:
+        raise ValueError(f"Mode '{name}': unknown pipeline '{pipeline}' (expected one of {PIPELINES})")
+    image_level = spec.get("image_level")
+    if image_level is not None and image_level not in IMAGE_LEVELS:
+        raise ValueError(f"Mode '{name}': unknown image_level '{image_level}' (expected one of {IMAGE_LEVELS})")
+
+    # Single-call modes describe their only step at the top level
+    step_specs = spec["steps"] if pipeline != "single" else {"main": spec}
+    steps = {}
+    for step_name, step_spec in step_specs.items():
+        configs = {level: _build_config(step_spec, level) for level in [None, *IMAGE_LEVELS]}
+        steps[step_name] = Step(
+            name=step_name,
+            model=step_spec.get("model", "gemini-2.5-flash-lite"),
+            prompt=step_spec.get("prompt", ""),
+            configs=MappingProxyType(configs),
+            spec=MappingProxyType(dict(step_spec)),
+        )
+
+    hotkey = spec.get("hotkey")
+    if spec.get("hotkey_env"):
+        hotkey = os.getenv(spec["hotkey_env"], hotkey)
+
+    return Mode(
+        name=name,
+        label=spec.get("label", name),
+        hotkey=hotkey,
+        pipeline=pipeline,
+        needs_audio=spec.get("needs_audio", True),
+        paste=spec.get("paste", True),
+        image_level=image_level,
+        adaptive_budget=spec.get("adaptive_budget", False),
+        segmented=spec.get("segmented", False),
+        steps=MappingProxyType(steps),
+        spec=MappingProxyType(dict(spec)),
+    )
+
+
+class ModeRegistry:
+    """Modes loaded once from modes/*.json. Add a file there to add a mode on its own hotkey."""
+
+    def __init__(self, modes):
+        self.modes = {mode.name: mode for mode in modes}
+
+    @classmethod
+    def load(cls, directory: str = None) -> "ModeRegistry":
+        directory = directory or MODES_DIR
+        modes = []
+        for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    modes.append(build_mode(json.load(f)))
+            except Exception as e:
+                logger.warning(f"Mode file ignored ({os.path.basename(path)}): {e}")
+        if not modes:
+            raise ValueError(f"No mode found in {directory}")
+        logger.info(f"Modes loaded: {', '.join(f'{m.name} ({m.hotkey})' for m in modes)}")
+        return cls(modes)
+
+    def get(self, name: str) -> Mode:
+        if name not in self.modes:
+            raise KeyError(f"Unknown mode '{name}' (available: {', '.join(self.modes)})")
+        return self.modes[name]
+
+    def names(self):
+        return list(self.modes)
+
+    def by_hotkey(self):
+        """Modes with a hotkey, combinations first so 'ctrl+f9' wins over 'f9'."""
+        with_keys = [mode for mode in self.modes.values() if mode.hotkey]
+        return sorted(with_keys, key=lambda mode: -mode.hotkey.count("+"))
+
+    def derive(self, name: str, **overrides) -> Mode:
+        """Builds a variant of a mode (not registered), e.g. for evaluations.
+
+        Step keys of multi-step modes are overridden as "steps.<step>.<key>" (e.g.
+        steps.drafting.model); a bare step key would be silently ignored there, so it raises.
+        """
+        spec = dict(self.get(name).spec)
+        single = spec.get("pipeline", "single") == "single"
+        steps = {step: dict(step_spec) for step, step_spec in spec.get("steps", {}).items()}
+        for key, value in overrides.items():
+            if key.startswith("steps."):
+                parts = key.split(".")
+                if len(parts) != 3:
+                    raise ValueError(f"Override '{key}': expected steps.<step>.<key>")
+                step, step_key = parts[1], parts[2]
+                if single and step == "main":
+                    spec[step_key] = value
+                elif step in steps:
+                    steps[step][step_key] = value
+                else:
+                    raise ValueError(f"Mode '{name}' has no step '{step}' (steps: {', '.join(steps) or 'main'})")
+            elif key in STEP_KEYS and not single:
+                raise ValueError(f"Mode '{name}' has several steps: override '{key}' per step "
+                                 f"({', '.join(f'steps.{step}.{key}' for step in steps)})")
+            else:
+                spec[key] = value
+        if steps:
+            spec["steps"] = steps
+        return build_mode(spec)
@@ -0,0 +1,193 @@
+import io
+import logging
+import math
+import re
+import threading
+import time
+import wave
+
+logger = logging.getLogger(__name__)
+
+# Per-model limits (requests / tokens per minute). Override in config.json under "quota".
+DEFAULT_LIMITS = {
+    "gemini-2.5-flash-lite": {"rpm": 4000, "tpm": 4000000},
+    "gemini-3-flash-preview": {"rpm": 1000, "tpm": 1000000},
+    "gemini-2.5-pro": {"rpm": 150, "tpm": 2000000},
+    "gemini-3-pro-preview": {"rpm": 25, "tpm": 1000000},
+    "gemini-3-pro-image-preview": {"rpm": 20, "tpm": 100000},
+}
+FALLBACK_LIMITS = {"rpm": 60, "tpm": 250000}
+
+# Token cost estimates (https://ai.google.dev/gemini-api/docs/tokens)
+AUDIO_TOKENS_PER_SECOND = 32
+IMAGE_TOKENS_BY_RESOLUTION = {"LOW": 280, "MEDIUM": 560, "HIGH": 1120}
+IMAGE_TOKENS_PER_TILE = 258
+IMAGE_TILE_SIZE = 768
+CHARS_PER_TOKEN = 4
+
+RETRY_DELAY_PATTERN = re.compile(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s")
+
+
+def is_rate_limit_error(error) -> bool:
+    error_str = str(error)
+    return getattr(error, "code", None) == 429 or "429" in error_str or "RESOURCE_EXHAUSTED" in error_str
+
+
+def parse_retry_delay(error):
+    """Extracts the server-suggested delay (seconds) from a 429 error, or None."""
+    match = RETRY_DELAY_PATTERN.search(str(error))
+    return float(match.group(1)) if match else None
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        # A request larger than the whole bucket only waits for a full bucket
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+
+class QuotaScheduler:
+    """Client-side RPM/TPM token buckets per model.
+
+    acquire() blocks until the model has headroom for the estimated request, or
+    downgrades to an alternate model when the wait would exceed max_wait. 429
+    responses block the model for the server-suggested delay.
+    """
+
+    def __init__(self, limits: dict = None, alternates: dict = None, max_wait: float = 3.0):
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self.alternates = alternates or {}
+        self.max_wait = max_wait
+        self.buckets = {}
+        self.blocked_until = {}
+        self.lock = threading.Lock()
+
+    def _buckets(self, model: str):
+        if model not in self.buckets:
+            limits = self.limits.get(model, FALLBACK_LIMITS)
+            self.buckets[model] = (TokenBucket(limits["rpm"]), TokenBucket(limits["tpm"]))
+        return self.buckets[model]
+
+    def _wait_time(self, model: str, tokens: int, now: float) -> float:
+        requests, token_bucket = self._buckets(model)
+        requests.refill(now)
+        token_bucket.refill(now)
+        blocked = max(0.0, self.blocked_until.get(model, 0.0) - now)
+        return max(blocked, requests.wait_time(1), token_bucket.wait_time(tokens))
+
+    def estimate_tokens(self, contents, config=None) -> int:
+        """Estimates the input tokens of a request before sending it."""
+        resolution = None
+        if config is not None and getattr(config, "media_resolution", None):
+            resolution = str(config.media_resolution).rsplit("_", 1)[-1].upper()
+
+        parts = contents if isinstance(contents, list) else [contents]
+        total = 0
+        if config is not None and getattr(config, "system_instruction", None):
+            total += len(str(config.system_instruction)) // CHARS_PER_TOKEN
+        for part in parts:
+            if isinstance(part, str):
+                total += len(part) // CHARS_PER_TOKEN
+                continue
+            inline = getattr(part, "inline_data", None)
+            if inline is None or inline.data is None:
+                continue
+            if inline.mime_type.startswith("audio/"):
+                total += self._audio_tokens(inline.data)
+            elif inline.mime_type.startswith("image/"):
+                total += self._image_tokens(inline.data, resolution)
+        return max(1, total)
+
+    def _audio_tokens(self, data: bytes) -> int:
+        try:
+            with wave.open(io.BytesIO(data)) as w:
+                duration = w.getnframes() / w.getframerate()
+        except Exception:
+            # Unknown container: assume 16-bit mono 44.1 kHz
+            duration = len(data) / (44100 * 2)
+        return int(math.ceil(duration * AUDIO_TOKENS_PER_SECOND))
+
+    def _image_tokens(self, data: bytes, resolution: str = None) -> int:
+        if resolution in IMAGE_TOKENS_BY_RESOLUTION:
+            return IMAGE_TOKENS_BY_RESOLUTION[resolution]
+        try:
+            from PIL import Image
+            with Image.open(io.BytesIO(data)) as image:
+                width, height = image.size
+        except Exception:
+            return IMAGE_TOKENS_BY_RESOLUTION["HIGH"]
+        tiles = math.ceil(width / IMAGE_TILE_SIZE) * math.ceil(height / IMAGE_TILE_SIZE)
+        return tiles * IMAGE_TOKENS_PER_TILE
+
+    def acquire(self, model: str, tokens: int, sleep=None) -> str:
+        """Reserves quota for one request. Returns the model to use (possibly an alternate).
+
+        sleep replaces time.sleep while waiting for headroom (e.g. an interruptible one).
+        """
+        tried = {model}
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = self._wait_time(model, tokens, now)
+
+                if wait > self.max_wait and self.alternates.get(model) not in (None, *tried):
+                    alternate = self.alternates[model]
+                    tried.add(alternate)
+                    if self._wait_time(alternate, tokens, now) < wait:
+                        logger.info(f"{model} needs {wait:.1f}s of headroom. Downgrading to {alternate}.")
+                        model = alternate
+                        continue
+
+                if wait <= 0:
+                    requests, token_bucket = self._buckets(model)
+                    requests.level -= 1
+                    token_bucket.level -= tokens
+                    return model
+
+            logger.info(f"Waiting {wait:.2f}s for {model} headroom ({tokens} tokens)...")
+            (sleep or time.sleep)(wait)
+
+    def record_usage(self, model: str, estimated: int, actual: int):
+        """Corrects the token bucket once the real token count is known."""
+        if not actual:
+            return
+        with self.lock:
+            self._buckets(model)[1].level -= actual - estimated
+
+    def penalize(self, model: str, delay: float):
+        """Blocks a model after a 429 for the server-suggested delay."""
+        with self.lock:
+            self.blocked_until[model] = max(self.blocked_until.get(model, 0.0), time.monotonic() + delay)
+            # The server disagrees with our estimate: drain the request bucket too
+            self._buckets(model)[0].level = 0
+
+    def headroom(self) -> dict:
+        """Current remaining requests/tokens per minute for every model seen or configured."""
+        report = {}
+        with self.lock:
+            now = time.monotonic()
+            for model in sorted(set(self.limits) | set(self.buckets)):
+                requests, token_bucket = self._buckets(model)
+                requests.refill(now)
+                token_bucket.refill(now)
+                report[model] = {
+                    "rpm_left": int(requests.level),
+                    "rpm_limit": int(requests.capacity),
+                    "tpm_left": int(token_bucket.level),
+                    "tpm_limit": int(token_bucket.capacity),
+                    "blocked_for": round(max(0.0, self.blocked_until.get(model, 0.0) - now), 1),
+                }
+        return report
@@ -3,13 +3,24 @@ import numpy as np
 import scipy.io.wavfile as wav
 import tempfile
 import os
+import logging
+
+from app_logging import AudioCallbackLog
+from audio_conditioning import AudioConditioner
+
+logger = logging.getLogger(__name__)
 
 class AudioRecorder:
-    def __init__(self, fs=44100, channels=1):
+    def __init__(self, fs=44100, channels=1, spool=None, conditioning=None):
         self.fs = fs
         self.channels = channels
         self.recording = []
         self.stream = None
+        self.spool = spool
+        self.callback_log = AudioCallbackLog(logger)
+        self.on_chunk = None
+        self.conditioning = conditioning  # AudioConditioner settings (see audio_conditioning.settings_for)
+        self.conditioner = None
 
     def list_devices(self):
         """Returns a filtered list of unique input devices (id, name)."""
@@ -43,9 +54,17 @@ class AudioRecorder:
         
         return input_devices
 
-    def start(self, device_index=None):
-        """Starts recording audio from the specified or default microphone."""
+    def start(self, device_index=None, on_chunk=None):
+        """Starts recording audio from the specified or default microphone.
+
+        on_chunk, if given, receives a copy of every block from the audio callback
+        (PortAudio thread): it must only hand the block over, e.g. put it on a queue.
+        """
         self.recording = [] # Reset recording
+        self.on_chunk = on_chunk
+        # Fresh filter/gain state per recording
+        enabled = self.conditioning and self.conditioning.get("enabled", True)
+        self.conditioner = AudioConditioner(self.fs, self.channels, **self.conditioning) if enabled else None
         try:
             self.stream = sd.InputStream(
                 device=device_index,
@@ -54,60 +73,81 @@ class AudioRecorder:
                 callback=self._callback
             )
             self.stream.start()
-            print(f"Enregistrement démarré (Device ID: {device_index})...")
+            logger.info("Enregistrement démarré (Device ID: %s)...", device_index)
         except Exception as e:
-            print(f"[ERROR] Impossible de démarrer l'enregistrement sur le device {device_index}: {e}")
+            logger.error("Impossible de démarrer l'enregistrement sur le device %s: %s", device_index, e)
             # Fallback to default if specific fails
             if device_index is not None:
-                print("Tentative avec le périphérique par défaut...")
-                self.start(device_index=None)
+                logger.info("Tentative avec le périphérique par défaut...")
+                self.start(device_index=None, on_chunk=on_chunk)
 
-    def stop(self) -> str:
-        """Stops recording and saves to a temporary WAV file. Returns the file path."""
+    def stop(self, request_id: str = None) -> str:
+        """Stops recording and saves to a WAV file (in the spool if any). Returns the file path."""
         if self.stream:
             self.stream.stop()
             self.stream.close()
             self.stream = None
+        self.on_chunk = None
         
-        print("[RECORDER] Stopping stream...")
+        logger.info("Stopping stream...")
+        self.callback_log.drain()
         
         if not self.recording:
-            print("[RECORDER] Warn: No data recorded (list is empty).")
+            logger.warning("No data recorded (list is empty).")
             return None
 
-        # Concatenate all blocks
+        # Concatenate all blocks (and drop them: they'd otherwise live until the next recording)
         try:
             myrecording = np.concatenate(self.recording, axis=0)
         except ValueError:
-            print("[RECORDER] Error: Concatenation failed (empty chunks?)")
+            logger.error("Concatenation failed (empty chunks?)")
             return None
+        finally:
+            self.recording = []
             
         # Stats
         total_samples = len(myrecording)
         duration_sec = total_samples / self.fs
         max_amp = np.max(np.abs(myrecording)) if total_samples > 0 else 0
         
-        print(f"[RECORDER] Stats: Duration={duration_sec:.2f}s, Samples={total_samples}, MaxAmp={max_amp:.4f}")
+        logger.info("Stats: Duration=%.2fs, Samples=%s, MaxAmp=%.4f", duration_sec, total_samples, max_amp)
+        if self.conditioner:
+            conditioning = self.conditioner.summary()
+            logger.info("Conditioning: gain %s dB, %s sample(s) limited", conditioning['gain_db'], conditioning['clipped'])
         
         if max_amp < 0.001:
-            print("[RECORDER] WARNING: Audio is essentially SILENT.")
+            logger.warning("Audio is essentially SILENT.")
         
-        # Convert to int16 to ensure standard PCM WAV format (more compatible)
-        myrecording = (myrecording * 32767).astype(np.int16)
+        path = self.save_wav(myrecording, request_id)
+        file_size = os.path.getsize(path)
+        logger.info("File saved: %s (%s bytes)", path, file_size)
         
-        # Create a temp file
-        fd, path = tempfile.mkstemp(suffix=".wav")
-        os.close(fd)
+        return path
+
+    def save_wav(self, samples, request_id: str = None, kind: str = "audio") -> str:
+        """Writes float samples as a 16-bit PCM WAV (in the spool if any). Returns the path."""
+        # Convert to int16 to ensure standard PCM WAV format (more compatible).
+        # Clip first: out-of-range floats would wrap around instead of saturating.
+        pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
         
-        # Save WAV
-        wav.write(path, self.fs, myrecording)
-        file_size = os.path.getsize(path)
-        print(f"[RECORDER] File saved: {path} ({file_size} bytes)")
+        # Create the target file
+        if self.spool:
+            path = self.spool.allocate(request_id, kind, ".wav")
+        else:
+            fd, path = tempfile.mkstemp(suffix=".wav")
+            os.close(fd)
         
+        # Save WAV
+        wav.write(path, self.fs, pcm)
+        if self.spool:
+            path = self.spool.commit(path, meta={"duration": round(len(samples) / self.fs, 2), "fs": self.fs})
         return path
 
     def _callback(self, indata, frames, time, status):
-        """Callback for sounddevice."""
+        """Callback for sounddevice. Runs on the PortAudio thread: no I/O or formatting here."""
         if status:
-            print(status)
-        self.recording.append(indata.copy())
+            self.callback_log.note(status)
+        chunk = self.conditioner.process(indata) if self.conditioner else indata.copy()
+        self.recording.append(chunk)
+        if self.on_chunk:
+            self.on_chunk(chunk)
@@ -0,0 +1,48 @@
+import collections
+import threading
+import time
+
+
+class ReportCache:
+    """Recent report-mode answers keyed by window title + perceptual hash of the region under the cursor.
+
+    Pressing Debug again on the same screen returns the previous report instead of
+    sending another HIGH-resolution screenshot. Hashes within max_distance bits
+    count as the same screen (caret blink, clock, antialiasing).
+    """
+
+    def __init__(self, ttl_sec: float = 600, max_distance: int = 4, max_entries: int = 50):
+        self.ttl = ttl_sec
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()  # (window title, fingerprint) -> (created, report)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, window_title: str, fingerprint: int):
+        if fingerprint is None:
+            return None
+        now = time.time()
+        with self.lock:
+            for key in list(self.entries):
+                created, report = self.entries[key]
+                if now - created > self.ttl:
+                    del self.entries[key]
+                    continue
+                title, cached = key
+                if title == window_title and (cached ^ fingerprint).bit_count() <= self.max_distance:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return report
+            self.misses += 1
+        return None
+
+    def put(self, window_title: str, fingerprint: int, report: str):
+        if fingerprint is None or not report:
+            return
+        with self.lock:
+            self.entries[(window_title, fingerprint)] = (time.time(), report)
+            self.entries.move_to_end((window_title, fingerprint))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
@@ -0,0 +1,215 @@
+import logging
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEGMENTATION = {
+    "frame_ms": 30,          # VAD frame
+    "min_segment_sec": 8,    # Don't cut before this much audio
+    "max_segment_sec": 30,   # Force a cut (at the quietest frame) after this
+    "min_pause_ms": 400,     # Silence needed to cut
+    "overlap_ms": 300,       # Audio repeated at the start of the next segment
+    "speech_margin_db": 10,  # Speech = this much above the noise floor
+    "workers": 3,
+}
+
+# The 300 ms overlap repeats at most a few words; a longer match is more likely a real repetition
+_STITCH_WORDS = 4
+
+
+def _words(text: str):
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def stitch(texts) -> str:
+    """Joins segment transcripts, dropping words repeated across a boundary by the audio overlap."""
+    result = ""
+    for text in texts:
+        text = (text or "").strip()
+        if not text:
+            continue
+        if not result:
+            result = text
+            continue
+        tail = _words(result)[-_STITCH_WORDS:]
+        tokens = text.split()
+        head = [_words(token) for token in tokens[:_STITCH_WORDS]]
+        drop = 0
+        for k in range(min(len(tail), len(head)), 0, -1):
+            head_words = [w for token_words in head[:k] for w in token_words]
+            if head_words and head_words == tail[-len(head_words):]:
+                drop = k
+                break
+        remainder = " ".join(tokens[drop:])
+        if remainder:
+            result = f"{result} {remainder}"
+    return result
+
+
+class LongFormSession:
+    """Splits a recording at pauses while it is captured and transcribes segments concurrently.
+
+    feed() is called from the audio callback and only queues the block. A worker
+    thread runs an energy VAD on fixed frames and, once a segment is long enough
+    and followed by a pause, cuts it in the middle of the pause, saves it and
+    submits it for transcription. finish() flushes the last segment, waits for
+    all of them and stitches the texts in order, so the latency after release is
+    roughly that of the last segment.
+    """
+
+    def __init__(self, client, mode, recorder, request_id=None, window_title=None, image_path=None, cancel=None):
+        self.client = client
+        self.mode = mode
+        self.recorder = recorder
+        self.fs = recorder.fs
+        self.request_id = request_id
+        self.window_title = window_title
+        self.image_path = image_path
+        self.cancel = cancel
+
+        params = dict(DEFAULT_SEGMENTATION)
+        params.update(mode.spec.get("segmentation", {}))
+        self.frame_len = int(self.fs * params["frame_ms"] / 1000)
+        self.min_segment = int(self.fs * params["min_segment_sec"])
+        self.max_segment = int(self.fs * params["max_segment_sec"])
+        self.min_pause = int(self.fs * params["min_pause_ms"] / 1000)
+        self.overlap = int(self.fs * params["overlap_ms"] / 1000)
+        self.speech_margin_db = params["speech_margin_db"]
+
+        self.blocks = queue.SimpleQueue()
+        self.executor = ThreadPoolExecutor(max_workers=params["workers"], thread_name_prefix="segment")
+        self.futures = []
+
+        # VAD state (worker thread only)
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.frames = []        # Frames of the current segment
+        self.frame_db = []      # Their energy
+        self.frame_speech = []  # And whether the VAD took them for speech
+        self.segment_len = 0
+        self.silence_run = 0
+        self.prefix = np.zeros(0, dtype=np.float32)  # Overlap carried into the next segment
+        self.noise_floor = None
+
+        self.worker = threading.Thread(target=self._run, daemon=True, name="segmenter")
+        self.worker.start()
+
+    def feed(self, chunk):
+        """Audio callback side: never blocks."""
+        self.blocks.put(chunk)
+
+    def finish(self) -> str:
+        """Stitched text of all segments. Raises if one failed: text with a hole must not be pasted."""
+        self.blocks.put(None)
+        self.worker.join()
+        self._cut(self.segment_len, final=True)
+        texts = []
+        try:
+            for index, future in enumerate(self.futures):
+                try:
+                    texts.append(future.result())
+                except Exception as e:
+                    # process_audio already retried; the full recording stays in the spool for a replay
+                    raise RuntimeError(f"Segment {index} of {len(self.futures)} failed: {e}") from e
+        except BaseException:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        self.executor.shutdown(wait=False)
+        text = stitch(texts)
+        logger.info(f"Long-form: {len(self.futures)} segment(s) stitched ({len(text)} chars)")
+        return text
+
+    def _run(self):
+        while True:
+            block = self.blocks.get()
+            if block is None:
+                break
+            samples = block[:, 0] if block.ndim > 1 else block
+            self.pending = np.concatenate((self.pending, samples.astype(np.float32, copy=False)))
+            while len(self.pending) >= self.frame_len:
+                frame, self.pending = self.pending[:self.frame_len], self.pending[self.frame_len:]
+                self._process_frame(frame)
+        if len(self.pending):
+            self._process_frame(self.pending)
+            self.pending = np.zeros(0, dtype=np.float32)
+
+    def _is_speech(self, db: float) -> bool:
+        if self.noise_floor is None:
+            self.noise_floor = db
+        # Floor follows quiet frames immediately and rises slowly (~0.5 dB/s at 30 ms frames)
+        if db < self.noise_floor:
+            self.noise_floor = db
+        else:
+            self.noise_floor += 0.015
+        return db > max(self.noise_floor + self.speech_margin_db, -55.0)
+
+    def _process_frame(self, frame):
+        db = 20 * np.log10(np.sqrt(np.mean(frame ** 2)) + 1e-9)
+        speech = self._is_speech(db)
+        self.frames.append(frame)
+        self.frame_db.append(db)
+        self.frame_speech.append(speech)
+        self.segment_len += len(frame)
+        if speech:
+            self.silence_run = 0
+        else:
+            self.silence_run += len(frame)
+
+        if self.segment_len >= self.min_segment and self.silence_run >= self.min_pause:
+            self._cut(self.segment_len - self.silence_run // 2)
+        elif self.segment_len >= self.max_segment:
+            # No pause: cut at the quietest frame of the last second
+            window = min(len(self.frame_db), max(1, self.fs // self.frame_len))
+            quietest = len(self.frame_db) - window + int(np.argmin(self.frame_db[-window:]))
+            self._cut(sum(len(f) for f in self.frames[:quietest + 1]))
+
+    def _cut(self, position: int, final: bool = False):
+        if not self.frames:
+            return
+        # Split at position; the tail frames keep their energy and speech flag, so speech
+        # left after a forced cut is still sent even if only silence follows
+        head, head_speech = [], False
+        tail, tail_db, tail_speech = [], [], []
+        offset = 0
+        for frame, db, speech in zip(self.frames, self.frame_db, self.frame_speech):
+            split = min(max(position - offset, 0), len(frame))
+            offset += len(frame)
+            if split:
+                head.append(frame[:split])
+                head_speech = head_speech or speech
+            if split < len(frame):
+                tail.append(frame[split:])
+                tail_db.append(db)
+                tail_speech.append(speech)
+        head = np.concatenate(head) if head else np.zeros(0, dtype=np.float32)
+
+        if head_speech and len(head):
+            segment = np.concatenate((self.prefix, head))
+            self._dispatch(segment)
+        self.prefix = head[-self.overlap:] if self.overlap else np.zeros(0, dtype=np.float32)
+
+        # The remainder starts the next segment
+        self.frames, self.frame_db, self.frame_speech = tail, tail_db, tail_speech
+        self.segment_len = sum(len(frame) for frame in tail)
+        self.silence_run = min(self.silence_run, self.segment_len)
+        if final and self.segment_len:
+            self._cut(self.segment_len)
+
+    def _dispatch(self, segment):
+        index = len(self.futures)
+        path = self.recorder.save_wav(segment, self.request_id, kind=f"segment{index:03d}")
+        logger.info(f"Segment {index} dispatched ({len(segment) / self.fs:.1f}s)")
+        # The screenshot only goes with the first segment: the context doesn't change
+        image_path = self.image_path if index == 0 else None
+        self.futures.append(self.executor.submit(self._transcribe, index, path, image_path))
+
+    def _transcribe(self, index, path, image_path):
+        started = time.perf_counter()
+        text = self.client.process_audio(path, image_path, self.window_title, mode=self.mode, request_id=self.request_id, cancel=self.cancel)
+        logger.info(f"Segment {index} transcribed in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return text
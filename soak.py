@@ -0,0 +1,315 @@
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+
+import context_provider
+import diagnostics
+import main as app_main
+import recorder
+from app_logging import setup_logging
+from audio_conditioning import settings_for
+from context_provider import ContextProvider
+from llm_client import GeminiClient
+from modes import ModeRegistry
+from recorder import AudioRecorder
+from spool import Spool
+
+logger = logging.getLogger(__name__)
+
+
+class FakeKeyboard:
+    """Replaces the keyboard module in main: keys are pressed and released by the driver."""
+
+    def __init__(self):
+        self.pressed = set()
+        self.sent = 0
+
+    def is_pressed(self, hotkey):
+        return all(key.strip().lower() in self.pressed for key in hotkey.split("+"))
+
+    def press(self, hotkey):
+        self.pressed = {key.strip().lower() for key in hotkey.split("+")}
+
+    def release(self):
+        self.pressed = set()
+
+    def send(self, keys):
+        self.sent += 1
+
+
+class FakeInputStream:
+    """sd.InputStream feeding a tone plus noise to the callback in 10 ms blocks, in real time."""
+
+    def __init__(self, device=None, samplerate=44100, channels=1, callback=None, **kwargs):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.callback = callback
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        frames = self.samplerate // 100
+        rng = np.random.default_rng()
+        position = 0
+        while self.running:
+            t = (np.arange(frames) + position) / self.samplerate
+            block = 0.2 * np.sin(2 * np.pi * 220 * t) + 0.01 * rng.standard_normal(frames)
+            self.callback(np.repeat(block[:, None], self.channels, axis=1).astype(np.float32), frames, None, None)
+            position += frames
+            time.sleep(0.01)
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+
+    def close(self):
+        self.thread = None
+
+
+class FakeScreenshot:
+    def __init__(self, width, height):
+        self.size = (width, height)
+        self.bgra = bytes(width * height * 4)
+
+
+class FakeMss:
+    """mss.mss() context manager returning a blank monitor of the given size."""
+
+    def __init__(self, width=1920, height=1080):
+        self.width, self.height = width, height
+        self.monitors = [
+            {"left": 0, "top": 0, "width": width, "height": height},
+            {"left": 0, "top": 0, "width": width, "height": height},
+        ]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def grab(self, monitor):
+        return FakeScreenshot(monitor["width"], monitor["height"])
+
+
+class FakeModels:
+    """client.models of google-genai, answering after a fixed latency."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def _response(self):
+        self.calls += 1
+        return SimpleNamespace(text="Ceci est une phrase de test.", usage_metadata=None, model_version=None, parts=[])
+
+    def generate_content(self, model, contents, config=None):
+        time.sleep(self.latency)
+        return self._response()
+
+    def generate_content_stream(self, model, contents, config=None):
+        yield self.generate_content(model, contents, config)
+
+
+class FakeAsyncModels:
+    """client.aio.models (used for cancellable requests), sharing the sync fake's counters."""
+
+    def __init__(self, models):
+        self.models = models
+
+    async def generate_content(self, model, contents, config=None):
+        await asyncio.sleep(self.models.latency)
+        return self.models._response()
+
+    async def generate_content_stream(self, model, contents, config=None):
+        response = await self.generate_content(model, contents, config)
+
+        async def chunks():
+            yield response
+        return chunks()
+
+
+def install_fakes(latency, screen_size):
+    keyboard = FakeKeyboard()
+    app_main.keyboard = keyboard
+    app_main.pyperclip = SimpleNamespace(copy=lambda text: None)
+    recorder.sd = SimpleNamespace(InputStream=FakeInputStream, query_devices=lambda: [])
+    context_provider.mss = SimpleNamespace(mss=lambda: FakeMss(*screen_size))
+    context_provider.pyautogui = SimpleNamespace(position=lambda: (screen_size[0] // 2, screen_size[1] // 2))
+    context_provider.gw = SimpleNamespace(getActiveWindow=lambda: SimpleNamespace(title="Soak test - Notepad"))
+    os.environ.setdefault("GEMINI_API_KEY", "soak-test")
+    return keyboard, FakeModels(latency)
+
+
+def build_app(fake_models, spool_dir, spool_mb):
+    """Same wiring as DictatingApp.setup_components, with a throwaway spool and no usage file."""
+    app = app_main.DictatingApp()
+    app.retrigger_delay = 0
+    app.spool = Spool(root=spool_dir, max_bytes=int(spool_mb * 1024 * 1024))
+    app.modes = ModeRegistry.load()
+    app.client = GeminiClient(spool=app.spool, modes=app.modes, adaptive_budget=False, usage_path=None)
+    app.client.client = SimpleNamespace(models=fake_models, aio=SimpleNamespace(models=FakeAsyncModels(fake_models)))
+    # Conditioning is opt-in in the app; enabled here so its per-block state is soaked too
+    conditioning = settings_for({"audio_conditioning": {"default": {"enabled": True}}})
+    app.recorder = AudioRecorder(spool=app.spool, conditioning=conditioning)
+    app.context_provider = ContextProvider(spool=app.spool)
+
+    delivered = threading.Semaphore(0)
+    deliver = app.deliver
+
+    def counting_deliver(mode, text, window_title=None):
+        deliver(mode, text, window_title)
+        delivered.release()
+
+    app.deliver = counting_deliver
+    return app, delivered
+
+
+def wait_until(condition, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def run(args) -> int:
+    """Presses the modes' hotkeys in turn and reports memory/handle/thread growth per request.
+
+    The real recorder, context provider, spool, segmenter and GeminiClient code runs;
+    only the edges (keyboard, PortAudio, screen grab, clipboard, Gemini API) are fake.
+    Returns 1 when a metric grows faster than the thresholds.
+    """
+    spool_dir = tempfile.mkdtemp(prefix="soak-spool-")
+    keyboard, fake_models = install_fakes(args.latency, (args.screen_width, args.screen_height))
+    app, delivered = build_app(fake_models, spool_dir, args.spool_mb)
+    modes = [app.modes.get(name) for name in args.modes.split(",")]
+    for mode in modes:
+        if not mode.hotkey:
+            raise SystemExit(f"Mode '{mode.name}' has no hotkey")
+
+    diagnostics.start_tracing(args.frames)
+    threading.Thread(target=app.listen_loop, daemon=True, name="listen_loop").start()
+
+    samples = []
+    baseline = None
+    failures = 0
+    started = time.perf_counter()
+    try:
+        for i in range(args.requests):
+            mode = modes[i % len(modes)]
+            keyboard.press(mode.hotkey)
+            if mode.needs_audio:
+                # The screenshot is taken before recorder.start: hold from the first recorded block
+                if not wait_until(lambda: app.recorder.recording, args.timeout):
+                    logger.warning(f"Request {i} ({mode.name}): recording did not start in {args.timeout}s")
+                time.sleep(args.hold)
+            else:
+                time.sleep(0.05)
+            keyboard.release()
+            if not delivered.acquire(timeout=args.timeout):
+                failures += 1
+                logger.warning(f"Request {i} ({mode.name}) did not complete in {args.timeout}s")
+
+            done = i + 1
+            if done == args.warmup:
+                # Until eviction runs, the spool index grows with every request, like a leak would
+                if app.spool.total_bytes() < 0.9 * app.spool.max_bytes:
+                    logger.warning(f"Spool not full after the warm-up ({app.spool.total_bytes() // 1024} KB): "
+                                   f"its index growth will count as heap growth; lower --spool-mb")
+                gc.collect()
+                baseline = tracemalloc.take_snapshot()
+            if done >= args.warmup and (done - args.warmup) % args.sample_every == 0:
+                gc.collect()
+                samples.append((done, diagnostics.sample()))
+                logger.warning(f"[{done}/{args.requests}] {diagnostics.format_sample(samples[-1][1])}")
+    finally:
+        app.running = False
+
+    gc.collect()
+    samples.append((args.requests, diagnostics.sample()))
+    final = tracemalloc.take_snapshot()
+    elapsed = time.perf_counter() - started
+
+    print(f"\n{args.requests} requests in {elapsed:.0f}s ({failures} timed out), {fake_models.calls} model calls")
+    print(f"Modes: {', '.join(mode.name for mode in modes)}; spool {app.spool.total_bytes() // 1024} KB")
+    print(f"Start: {diagnostics.format_sample(samples[0][1])}")
+    print(f"End:   {diagnostics.format_sample(samples[-1][1])}")
+    print("\nGrowth per request (after warm-up):")
+    growth = {}
+    for metric in ("traced_bytes", "rss_bytes", "handles", "gdi_objects", "threads", "gc_objects"):
+        points = [(n, values.get(metric)) for n, values in samples]
+        if all(y is None for _, y in points):
+            continue
+        growth[metric] = diagnostics.slope(points)
+        print(f"  {metric:<14} {growth[metric]:+.3f}")
+
+    if baseline:
+        print("\nTop allocation growth since warm-up:")
+        for where, size_diff, count_diff in diagnostics.top_growth(baseline, final, args.top):
+            print(f"  {size_diff / 1024:+9.1f} KB {count_diff:+7d} blocks  {where}")
+
+    shutil.rmtree(spool_dir, ignore_errors=True)
+
+    leaks = []
+    if growth.get("traced_bytes", 0) > args.max_bytes_per_request:
+        leaks.append(f"Python heap grows {growth['traced_bytes']:.0f} B/request")
+    if growth.get("handles", 0) > args.max_handles_per_request:
+        leaks.append(f"handles grow {growth['handles']:.3f}/request")
+    if growth.get("gdi_objects", 0) > args.max_handles_per_request:
+        leaks.append(f"GDI objects grow {growth['gdi_objects']:.3f}/request")
+    if growth.get("threads", 0) > args.max_handles_per_request:
+        leaks.append(f"threads grow {growth['threads']:.3f}/request")
+    if failures:
+        leaks.append(f"{failures} request(s) timed out")
+    for leak in leaks:
+        print(f"FAIL: {leak}")
+    return 1 if leaks else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Long-running leak test of the hotkey loop with fake backends.")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--modes", default="dictation,debug,translate_en", help="Comma-separated modes, used in turn")
+    parser.add_argument("--hold", type=float, default=0.3, help="Seconds the hotkey is held once recording has started")
+    parser.add_argument("--latency", type=float, default=0.02, help="Fake model latency in seconds")
+    parser.add_argument("--screen-width", type=int, default=1920)
+    parser.add_argument("--screen-height", type=int, default=1080)
+    parser.add_argument("--spool-mb", type=float, default=1,
+                        help="Small, so eviction runs before the end of the warm-up (~25 KB per request)")
+    parser.add_argument("--warmup", type=int, default=100, help="Requests before the baseline (caches fill up)")
+    parser.add_argument("--sample-every", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--frames", type=int, default=5, help="tracemalloc traceback depth")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-bytes-per-request", type=float, default=1024)
+    parser.add_argument("--max-handles-per-request", type=float, default=0.01)
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+    if args.requests <= args.warmup:
+        parser.error("--requests must be larger than --warmup")
+
+    setup_logging(level=args.log_level)
+    sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import copy
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SPOOL_DIR = os.path.join(tempfile.gettempdir(), "GeminiDictating", "spool")
+INDEX_FILE = "index.json"
+PARTIAL_MARKER = ".partial"
+# "<request_id>.<kind>...", request ids from new_request_id(): only such files are ever removed
+ARTIFACT_NAME = re.compile(r"^\d{8}-\d{6}-[0-9a-f]{6}\.")
+
+
+class Spool:
+    """Single directory holding the audio/screenshot artifacts of every request.
+
+    Each artifact is named "<request_id>.<kind><suffix>" and described in index.json
+    (size, creation and last access time, free-form metadata). The directory is kept
+    under max_bytes and max_age_days by evicting the least recently used artifacts.
+    Files are written under a ".partial" name and renamed once complete, so a crash
+    never leaves a half-written artifact in the index.
+    index.json is rewritten by a background thread at most every flush_delay seconds:
+    rewriting it takes ~100 ms with a few thousand requests, too long for the hotkey
+    thread. Call flush() before exiting.
+    """
+
+    def __init__(self, root: str = None, max_bytes: int = 500 * 1024 * 1024, max_age_days: float = 7,
+                 flush_delay: float = 1.0):
+        self.root = root or DEFAULT_SPOOL_DIR
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.index_path = os.path.join(self.root, INDEX_FILE)
+        self.lock = threading.RLock()
+        self.artifacts = {}  # file name -> metadata
+        self.requests = {}   # request id -> request-level metadata (mode, window title, ...)
+        self.flush_delay = flush_delay
+        self.dirty = threading.Event()
+        self.write_lock = threading.Lock()  # Serialises index writes (writer thread vs flush())
+        self.writer = None
+
+        os.makedirs(self.root, exist_ok=True)
+        index = self.read_index(self.root)
+        self.artifacts = index["artifacts"]
+        self.requests = index["requests"]
+        self.recover()
+
+    @staticmethod
+    def new_request_id() -> str:
+        """Sortable, unique id for one hotkey press."""
+        return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+    @staticmethod
+    def read_index(root: str) -> dict:
+        """Reads an index without touching the directory (safe while the app is running)."""
+        try:
+            with open(os.path.join(root, INDEX_FILE), "r", encoding="utf-8") as f:
+                index = json.load(f)
+            return {"artifacts": index.get("artifacts", {}), "requests": index.get("requests", {})}
+        except (FileNotFoundError, json.JSONDecodeError, AttributeError):
+            return {"artifacts": {}, "requests": {}}
+
+    def _save_index(self):
+        """Marks the index as changed; the writer thread saves it (callers hold self.lock)."""
+        self.dirty.set()
+        if self.writer is None:
+            self.writer = threading.Thread(target=self._write_loop, daemon=True, name="spool-index")
+            self.writer.start()
+
+    def _write_loop(self):
+        try:
+            while True:
+                self.dirty.wait()
+                time.sleep(self.flush_delay)  # Batches the changes of one request into one write
+                try:
+                    self.flush()
+                except Exception as e:
+                    # e.g. index.json locked by an antivirus: retried at the next round
+                    logger.warning(f"Could not save spool index: {e}")
+                    self.dirty.set()
+        finally:
+            # Never left without a writer: the next change starts a new one
+            with self.lock:
+                self.writer = None
+
+    def flush(self):
+        """Writes index.json now if it changed since the last write."""
+        with self.write_lock:
+            with self.lock:
+                if not self.dirty.is_set():
+                    return
+                self.dirty.clear()
+                # Entries are updated in place: copy them, then serialise outside the lock
+                index = {
+                    "artifacts": {name: dict(entry) for name, entry in self.artifacts.items()},
+                    "requests": {request_id: dict(meta) for request_id, meta in self.requests.items()},
+                }
+            tmp_path = self.index_path + PARTIAL_MARKER
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(index, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, self.index_path)
+
+    def recover(self):
+        """Startup cleanup: drops partial writes, unindexed files and entries whose file is gone."""
+        with self.lock:
+            removed = 0
+            for name in os.listdir(self.root):
+                path = os.path.join(self.root, name)
+                if not os.path.isfile(path):
+                    continue
+                # The spool dir may be an existing folder: leave files that aren't ours alone
+                if name == INDEX_FILE + PARTIAL_MARKER or (
+                        ARTIFACT_NAME.match(name) and (PARTIAL_MARKER in name or name not in self.artifacts)):
+                    try:
+                        os.remove(path)
+                        removed += 1
+                    except OSError as e:
+                        logger.warning(f"Could not remove orphan {name}: {e}")
+
+            for name in list(self.artifacts):
+                path = os.path.join(self.root, name)
+                if not os.path.exists(path):
+                    del self.artifacts[name]
+                else:
+                    self.artifacts[name]["size"] = os.path.getsize(path)
+
+            self._drop_empty_requests()
+            self._evict()
+            self._save_index()
+            if removed:
+                logger.info(f"Startup cleanup removed {removed} orphan file(s).")
+        self.flush()
+
+    def allocate(self, request_id: str, kind: str, suffix: str) -> str:
+        """Returns a temporary path to write an artifact to; pass it to commit() once written."""
+        request_id = request_id or self.new_request_id()
+        return os.path.join(self.root, f"{request_id}.{kind}{PARTIAL_MARKER}{suffix}")
+
+    def commit(self, partial_path: str, meta: dict = None) -> str:
+        """Moves a fully written artifact into the spool and indexes it. Returns its final path."""
+        name = os.path.basename(partial_path).replace(PARTIAL_MARKER, "", 1)
+        request_id, kind = name.split(".")[:2]
+        final_path = os.path.join(self.root, name)
+        os.replace(partial_path, final_path)
+
+        now = time.time()
+        with self.lock:
+            self.artifacts[name] = {
+                "request_id": request_id,
+                "kind": kind,
+                "size": os.path.getsize(final_path),
+                "created": now,
+                "accessed": now,
+                # Copied: the index is serialised later, outside the caller's control
+                "meta": copy.deepcopy(meta) if meta else {},
+            }
+            self.requests.setdefault(request_id, {"created": now})
+            self._evict(keep=name)
+            self._save_index()
+        return final_path
+
+    def annotate(self, request_id: str, **fields):
+        """Attaches request-level metadata (mode, window title, output text...)."""
+        if not request_id:
+            return
+        with self.lock:
+            self.requests.setdefault(request_id, {"created": time.time()}).update(copy.deepcopy(fields))
+            self._save_index()
+
+    def find(self, request_id: str) -> dict:
+        """Returns {kind: path} for a request's artifacts and marks them as recently used."""
+        found = {}
+        with self.lock:
+            for name, entry in self.artifacts.items():
+                if entry["request_id"] == request_id:
+                    entry["accessed"] = time.time()
+                    found[entry["kind"]] = os.path.join(self.root, name)
+            if found:
+                self._save_index()
+        return found
+
+    def total_bytes(self) -> int:
+        with self.lock:
+            return sum(entry["size"] for entry in self.artifacts.values())
+
+    def _evict(self, keep: str = None):
+        """Removes expired artifacts, then least recently used ones until under max_bytes."""
+        now = time.time()
+        victims = []
+        if self.max_age:
+            victims = [name for name, entry in self.artifacts.items()
+                       if name != keep and now - entry["created"] > self.max_age]
+
+        total = sum(entry["size"] for name, entry in self.artifacts.items() if name not in victims)
+        if self.max_bytes and total > self.max_bytes:
+            by_access = sorted(
+                (name for name in self.artifacts if name not in victims and name != keep),
+                key=lambda name: self.artifacts[name]["accessed"]
+            )
+            for name in by_access:
+                if total <= self.max_bytes:
+                    break
+                victims.append(name)
+                total -= self.artifacts[name]["size"]
+
+        for name in victims:
+            try:
+                os.remove(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # Still open elsewhere (Windows): retry at next eviction
+                logger.warning(f"Could not evict {name}: {e}")
+                continue
+            del self.artifacts[name]
+
+        if victims:
+            self._drop_empty_requests()
+
+    def _drop_empty_requests(self):
+        live = {entry["request_id"] for entry in self.artifacts.values()}
+        for request_id in list(self.requests):
+            if request_id not in live:
+                del self.requests[request_id]
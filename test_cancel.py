@@ -0,0 +1,174 @@
+import asyncio
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+from cancellation import CancelToken, RequestCancelled
+from llm_client import GeminiClient
+
+# Cancellation must free the worker well before any real network call would finish
+MAX_CANCEL_LATENCY = 0.25
+SLOW_CALL = 10.0
+
+
+class SlowModels:
+    """Fake client.models / client.aio.models that take SLOW_CALL seconds (or fail with `error`)."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.started = threading.Event()
+        self.aborted = threading.Event()
+
+    def generate_content(self, model, contents, config=None):
+        self.started.set()
+        if self.error:
+            raise Exception(self.error)
+        time.sleep(SLOW_CALL)
+        return SimpleNamespace(text="trop tard", usage_metadata=None, model_version=None)
+
+    async def generate_content_async(self, model, contents, config=None):
+        self.started.set()
+        if self.error:
+            raise Exception(self.error)
+        try:
+            await asyncio.sleep(SLOW_CALL)
+        except asyncio.CancelledError:
+            # What the HTTP client sees when the request task is cancelled
+            self.aborted.set()
+            raise
+        return SimpleNamespace(text="trop tard", usage_metadata=None, model_version=None)
+
+
+class StreamingModels:
+    """Fake async client answering in 50 ms, or streaming three chunks."""
+
+    async def generate_content_async(self, model, contents, config=None):
+        await asyncio.sleep(0.05)
+        return SimpleNamespace(text="rapide", usage_metadata=None, model_version=None)
+
+    async def generate_content_stream_async(self, model, contents, config=None):
+        async def chunks():
+            for text in ("un ", "deux ", "trois"):
+                await asyncio.sleep(0.01)
+                yield SimpleNamespace(text=text, usage_metadata=None, model_version=None)
+        return chunks()
+
+
+def make_client(models):
+    os.environ.setdefault("GEMINI_API_KEY", "test")
+    client = GeminiClient(adaptive_budget=False, usage_path=None)
+    client.client = SimpleNamespace(
+        models=models,
+        aio=SimpleNamespace(models=SimpleNamespace(
+            generate_content=models.generate_content_async,
+            generate_content_stream=getattr(models, "generate_content_stream_async", None),
+        )),
+    )
+    return client
+
+
+def cancel_latency(client, token, cancel_when):
+    """Starts a request on a worker, cancels it once cancel_when() is true; returns seconds until the worker is free."""
+    outcome = {}
+
+    def worker():
+        try:
+            outcome["text"] = client.process_audio(None, mode="translate_en", cancel=token)
+        except RequestCancelled as e:
+            outcome["cancelled"] = str(e)
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while not cancel_when() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    started = time.perf_counter()
+    token.cancel("test")
+    thread.join(timeout=SLOW_CALL)
+    latency = time.perf_counter() - started
+    assert not thread.is_alive(), "worker still busy after cancel"
+    assert outcome.get("cancelled") == "test", outcome
+    return latency
+
+
+def test_cancel_in_flight_call():
+    models = SlowModels()
+    client = make_client(models)
+    latency = cancel_latency(client, CancelToken(), models.started.is_set)
+    assert models.aborted.wait(1), "HTTP call was not aborted"
+    print(f"in-flight call: {latency * 1000:.1f} ms")
+    assert latency < MAX_CANCEL_LATENCY
+
+
+def test_cancel_backoff_sleep():
+    # 503 on every attempt: the worker spends 1 + 2 + 5 s in backoff sleeps
+    models = SlowModels(error="503 UNAVAILABLE: The model is overloaded")
+    client = make_client(models)
+    backing_off = time.monotonic() + 0.2
+    latency = cancel_latency(client, CancelToken(), lambda: time.monotonic() > backing_off)
+    assert models.started.is_set()
+    print(f"backoff sleep: {latency * 1000:.1f} ms")
+    assert latency < MAX_CANCEL_LATENCY
+
+
+def test_cancel_quota_wait():
+    models = SlowModels()
+    client = make_client(models)
+    # As after a 429 with a long retryDelay: acquire() waits for the model to be unblocked
+    model = client.modes.get("translate_en").main.model
+    client.quota.penalize(model, SLOW_CALL)
+    client.quota.alternates = {}
+    waiting = time.monotonic() + 0.1
+    latency = cancel_latency(client, CancelToken(), lambda: time.monotonic() > waiting)
+    assert not models.started.is_set(), "request sent despite the quota wait"
+    print(f"quota wait: {latency * 1000:.1f} ms")
+    assert latency < MAX_CANCEL_LATENCY
+
+
+def test_cancel_before_start():
+    models = SlowModels()
+    client = make_client(models)
+    token = CancelToken()
+    token.cancel("early")
+    try:
+        client.process_audio(None, mode="translate_en", cancel=token)
+        raise AssertionError("not cancelled")
+    except RequestCancelled:
+        pass
+
+
+def test_slow_on_delta_does_not_block_other_requests():
+    # on_delta writing to a slow IPC client: must not stall the event loop shared by all requests
+    client = make_client(StreamingModels())
+    release = threading.Event()
+    streamed = []
+
+    def slow_delta(text):
+        release.wait(SLOW_CALL)
+        streamed.append(text)
+
+    stream = threading.Thread(
+        target=lambda: streamed.append(client.process_audio(None, mode="translate_en", on_delta=slow_delta, cancel=CancelToken())),
+        daemon=True,
+    )
+    stream.start()
+    time.sleep(0.1)  # The stream is blocked in its first on_delta
+    started = time.perf_counter()
+    text = client.process_audio(None, mode="translate_en", cancel=CancelToken())
+    latency = time.perf_counter() - started
+    release.set()
+    stream.join(timeout=5)
+    print(f"request next to a blocked stream: {latency * 1000:.1f} ms")
+    assert text == "rapide"
+    assert latency < MAX_CANCEL_LATENCY
+    assert streamed == ["un ", "deux ", "trois", "un deux trois"], streamed
+
+
+if __name__ == "__main__":
+    for test in (test_cancel_in_flight_call, test_cancel_backoff_sleep, test_cancel_quota_wait, test_cancel_before_start,
+                 test_slow_on_delta_does_not_block_other_requests):
+        test()
+        print(f"{test.__name__}: OK")
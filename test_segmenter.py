@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from segmenter import LongFormSession
+
+FS = 16000
+
+
+class FakeRecorder:
+    """Keeps the segments instead of writing WAV files."""
+
+    fs = FS
+
+    def __init__(self):
+        self.segments = []
+
+    def save_wav(self, samples, request_id=None, kind="audio"):
+        self.segments.append(samples)
+        return kind
+
+
+class FakeClient:
+    """Returns the segment name as its transcript, or fails on the segments in `failing`."""
+
+    def __init__(self, failing=()):
+        self.failing = failing
+
+    def process_audio(self, audio_path, image_path=None, window_title=None, mode=None, request_id=None, cancel=None):
+        if audio_path in self.failing:
+            raise Exception("500 INTERNAL")
+        return audio_path
+
+
+def record(client, *parts):
+    """Feeds (seconds, amplitude) parts of noise to a session in 512-sample blocks, as the audio callback would."""
+    rng = np.random.default_rng(0)
+    audio = np.concatenate([amplitude * rng.standard_normal(int(seconds * FS)) for seconds, amplitude in parts])
+    audio = audio.astype(np.float32)
+    recorder = FakeRecorder()
+    session = LongFormSession(client, SimpleNamespace(spec={}), recorder)
+    for i in range(0, len(audio), 512):
+        session.feed(audio[i:i + 512, None])
+    return session, recorder, len(audio)
+
+
+def test_speech_after_forced_cut_is_sent():
+    # No pause before max_segment_sec: the forced cut leaves speech in the tail, followed only by silence
+    session, recorder, total = record(FakeClient(), (0.5, 0.001), (29.5, 0.1), (0.3, 0.001))
+    text = session.finish()
+    assert text == "segment000 segment001", text
+    # Every sample is in a segment (the next ones start with the overlap of the previous one)
+    overlap = session.overlap
+    covered = len(recorder.segments[0]) + sum(len(segment) - overlap for segment in recorder.segments[1:])
+    assert covered == total, (covered, total)
+
+
+def test_failed_segment_fails_the_request():
+    # Two segments separated by a pause; the first one fails
+    session, _, _ = record(FakeClient(failing={"segment000"}), (0.5, 0.001), (9, 0.1), (1, 0.001), (3, 0.1))
+    try:
+        text = session.finish()
+        raise AssertionError(f"partial text returned: {text!r}")
+    except RuntimeError as e:
+        assert "Segment 0 of 2" in str(e), e
+
+
+if __name__ == "__main__":
+    for test in (test_speech_after_forced_cut_is_sent, test_failed_segment_fails_the_request):
+        test()
+        print(f"{test.__name__}: OK")
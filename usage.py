@@ -0,0 +1,184 @@
+import difflib
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Image policies from most to least expensive. "NONE" means the screenshot is not sent.
+IMAGE_LEVELS = ["HIGH", "MEDIUM", "LOW", "NONE"]
+
+
+def app_from_title(window_title: str) -> str:
+    """'notes.txt - Notepad' -> 'Notepad'. Window titles usually end with the application name."""
+    if not window_title:
+        return "unknown"
+    return window_title.rsplit(" - ", 1)[-1].strip() or "unknown"
+
+
+def _save_json(path: str, data: dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def _load_json(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+class UsageTracker:
+    """Aggregates response usage_metadata per mode, model and application window."""
+
+    FIELDS = ["requests", "prompt", "text", "audio", "image", "output", "thoughts", "total"]
+
+    def __init__(self, path: str = "usage.json", save_every: int = 10):
+        # path=None keeps the totals in memory only (evaluations, tests)
+        self.path = path
+        self.save_every = save_every
+        self.lock = threading.Lock()
+        self.totals = _load_json(path) if path else {}
+        self.pending = 0
+
+    @staticmethod
+    def extract(response) -> dict:
+        """Returns the token breakdown of one response (missing fields count as 0)."""
+        usage = getattr(response, "usage_metadata", None)
+        counts = {field: 0 for field in UsageTracker.FIELDS}
+        counts["requests"] = 1
+        if usage is None:
+            return counts
+        counts["prompt"] = usage.prompt_token_count or 0
+        counts["output"] = usage.candidates_token_count or 0
+        counts["thoughts"] = getattr(usage, "thoughts_token_count", None) or 0
+        counts["total"] = usage.total_token_count or 0
+        for detail in usage.prompt_tokens_details or []:
+            modality = str(detail.modality).rsplit(".", 1)[-1].lower()
+            if modality in counts:
+                counts[modality] += detail.token_count or 0
+        return counts
+
+    def record(self, mode: str, window_title: str, response, model_name: str = None) -> dict:
+        counts = self.extract(response)
+        model = getattr(response, "model_version", None) or model_name or "unknown"
+        key = f"{mode}|{model}|{app_from_title(window_title)}"
+        with self.lock:
+            bucket = self.totals.setdefault(key, {field: 0 for field in self.FIELDS})
+            for field, value in counts.items():
+                bucket[field] = bucket.get(field, 0) + value
+            self.pending += 1
+            if self.pending >= self.save_every:
+                self._flush()
+        logger.debug("Token usage", extra={"key": key, **{f: counts[f] for f in ("prompt", "audio", "image", "text", "output")}})
+        return counts
+
+    def _flush(self):
+        if not self.path:
+            return
+        try:
+            _save_json(self.path, self.totals)
+            self.pending = 0
+        except OSError as e:
+            logger.warning(f"Could not save {self.path}: {e}")
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def grand_total(self) -> dict:
+        with self.lock:
+            return {field: sum(bucket.get(field, 0) for bucket in self.totals.values()) for field in self.FIELDS}
+
+    def summary(self, group_by: str = "mode") -> dict:
+        """Totals grouped by 'mode', 'model' or 'app'."""
+        position = ["mode", "model", "app"].index(group_by)
+        grouped = {}
+        with self.lock:
+            for key, bucket in self.totals.items():
+                name = key.split("|")[position]
+                target = grouped.setdefault(name, {field: 0 for field in self.FIELDS})
+                for field in self.FIELDS:
+                    target[field] += bucket.get(field, 0)
+        return grouped
+
+
+class BudgetController:
+    """Lowers the screenshot cost per (mode, app) once it is shown not to change the output.
+
+    Occasionally a request is "probed": after the real answer is returned, the same
+    request is replayed in the background with the next cheaper image level (lower
+    resolution, then no screenshot). When the cheaper variant agrees with the real
+    output often enough, it becomes the new level for that mode and app. A level
+    that keeps disagreeing is marked settled and no longer probed.
+    """
+
+    def __init__(self, path: str = "budget.json", probe_rate: float = 0.2, min_samples: int = 8,
+                 agreement: float = 0.9, similarity: float = 0.95):
+        self.path = path
+        self.probe_rate = probe_rate
+        self.min_samples = min_samples
+        self.agreement = agreement
+        self.similarity = similarity
+        self.lock = threading.Lock()
+        self.state = _load_json(path)
+
+    def _entry(self, mode: str, app: str, default_level: str) -> dict:
+        return self.state.setdefault(f"{mode}|{app}", {
+            "level": default_level, "probes": 0, "agreed": 0, "settled": False, "updated": time.time()
+        })
+
+    def plan(self, mode: str, window_title: str, default_level: str):
+        """Returns (image level to use, cheaper level to probe or None)."""
+        with self.lock:
+            entry = self._entry(mode, app_from_title(window_title), default_level)
+            level = entry["level"]
+            index = IMAGE_LEVELS.index(level)
+            if entry["settled"] or index + 1 >= len(IMAGE_LEVELS) or random.random() >= self.probe_rate:
+                return level, None
+            return level, IMAGE_LEVELS[index + 1]
+
+    def current_level(self, mode: str, window_title: str, default_level: str) -> str:
+        """The level plan() would use, without creating an entry (to skip useless captures)."""
+        with self.lock:
+            entry = self.state.get(f"{mode}|{app_from_title(window_title)}")
+            return entry["level"] if entry else default_level
+
+    def outputs_agree(self, reference: str, candidate: str) -> bool:
+        a = (reference or "").lower().split()
+        b = (candidate or "").lower().split()
+        return difflib.SequenceMatcher(None, a, b).ratio() >= self.similarity
+
+    def report(self, mode: str, window_title: str, probe_level: str, reference: str, candidate: str):
+        """Records a probe result and steps the level down once the cheaper one is proven."""
+        app = app_from_title(window_title)
+        agreed = self.outputs_agree(reference, candidate)
+        with self.lock:
+            entry = self.state.get(f"{mode}|{app}")
+            if not entry or IMAGE_LEVELS.index(probe_level) != IMAGE_LEVELS.index(entry["level"]) + 1:
+                return  # Level changed since the probe was planned
+            entry["probes"] += 1
+            entry["agreed"] += int(agreed)
+            entry["updated"] = time.time()
+            if entry["probes"] >= self.min_samples:
+                ratio = entry["agreed"] / entry["probes"]
+                if ratio >= self.agreement:
+                    logger.info(f"{mode}|{app}: {probe_level} matches the output in {ratio:.0%} of probes. Switching to it.")
+                    entry.update(level=probe_level, probes=0, agreed=0)
+                else:
+                    logger.info(f"{mode}|{app}: {probe_level} changes the output ({ratio:.0%} agreement). Keeping {entry['level']}.")
+                    entry["settled"] = True
+            try:
+                _save_json(self.path, self.state)
+            except OSError as e:
+                logger.warning(f"Could not save {self.path}: {e}")
+
+    def levels(self) -> dict:
+        with self.lock:
+            return {key: entry["level"] for key, entry in self.state.items()}